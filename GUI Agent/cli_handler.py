@@ -9,10 +9,13 @@ import os
 import json
 import requests
 import subprocess
+import time
 from pathlib import Path
 
 # API Configuration
 API_BASE_URL = "http://127.0.0.1:5000"
+JOB_POLL_INTERVAL = 1.0     # seconds between job status checks
+JOB_TIMEOUT = 3600          # give up on a job after this many seconds
 
 def check_api_status():
     """Check if the API server is running"""
@@ -35,6 +38,30 @@ def check_api_status():
         print("   Make sure the API server is running with: python api_server.py")
         return False
 
+def run_extraction_job(kind, pdf_path, data=None):
+    """Submit a PDF as an API job and poll until it finishes. Returns the result dict or None."""
+    with open(pdf_path, 'rb') as f:
+        response = requests.post(f"{API_BASE_URL}/api/jobs/{kind}", files={'pdf': f}, data=data, timeout=60)
+    if response.status_code != 202:
+        print(f"[ERROR] API Error: {response.status_code}")
+        return None
+    job_id = response.json()['job_id']
+    deadline = time.time() + JOB_TIMEOUT
+    last_progress = None
+    while time.time() < deadline:
+        status = requests.get(f"{API_BASE_URL}/api/jobs/{job_id}", timeout=10).json()
+        progress = status.get('progress', {})
+        if progress.get('pages_total') and progress != last_progress:
+            print(f"[INFO] Processing... page {progress['pages_done']}/{progress['pages_total']}")
+            last_progress = progress
+        if status['status'] == 'done':
+            return requests.get(f"{API_BASE_URL}/api/jobs/{job_id}/result", timeout=30).json()
+        if status['status'] == 'failed':
+            return {'error': status.get('error') or 'Job failed'}
+        time.sleep(JOB_POLL_INTERVAL)
+    print(f"[ERROR] Job {job_id} did not finish within {JOB_TIMEOUT} seconds")
+    return None
+
 def extract_pdf_outline(pdf_path):
     """Extract outline from PDF using API"""
     if not os.path.exists(pdf_path):
@@ -42,12 +69,8 @@ def extract_pdf_outline(pdf_path):
         return False
     
     try:
-        with open(pdf_path, 'rb') as f:
-            files = {'pdf': f}
-            response = requests.post(f"{API_BASE_URL}/api/outline", files=files, timeout=30)
-        
-        if response.status_code == 200:
-            result = response.json()
+        result = run_extraction_job('outline', pdf_path)
+        if result is not None:
             if 'error' in result:
                 print(f"[ERROR] {result['error']}")
                 return False
@@ -60,7 +83,6 @@ def extract_pdf_outline(pdf_path):
                     print(f"   {item['level']}: {item['text']} (Page {item['page']})")
                 return True
         else:
-            print(f"[ERROR] API Error: {response.status_code}")
             return False
     except Exception as e:
         print(f"[ERROR] {e}")
@@ -73,13 +95,9 @@ def extract_persona_insights(pdf_path, persona="PDF Analyst", job="Extract key i
         return False
     
     try:
-        with open(pdf_path, 'rb') as f:
-            files = {'pdf': f}
-            data = {'persona': json.dumps({"persona": persona, "job_to_be_done": job})}
-            response = requests.post(f"{API_BASE_URL}/api/persona", files=files, data=data, timeout=30)
-        
-        if response.status_code == 200:
-            result = response.json()
+        data = {'persona': json.dumps({"persona": persona, "job_to_be_done": job})}
+        result = run_extraction_job('persona', pdf_path, data)
+        if result is not None:
             if 'error' in result:
                 print(f"[ERROR] {result['error']}")
                 return False
@@ -93,7 +111,6 @@ def extract_persona_insights(pdf_path, persona="PDF Analyst", job="Extract key i
                     print(f"   {i+1}. {section['section_title']} (Page {section['page']})")
                 return True
         else:
-            print(f"[ERROR] API Error: {response.status_code}")
             return False
     except Exception as e:
         print(f"[ERROR] {e}")
@@ -106,12 +123,8 @@ def extract_semantic_outline(pdf_path):
         return False
     
     try:
-        with open(pdf_path, 'rb') as f:
-            files = {'pdf': f}
-            response = requests.post(f"{API_BASE_URL}/api/semantic-outline", files=files, timeout=30)
-        
-        if response.status_code == 200:
-            result = response.json()
+        result = run_extraction_job('semantic-outline', pdf_path)
+        if result is not None:
             if 'error' in result:
                 print(f"[ERROR] {result['error']}")
                 return False
@@ -124,7 +137,6 @@ def extract_semantic_outline(pdf_path):
                     print(f"   {item['level']}: {item['text']} (Page {item['page']})")
                 return True
         else:
-            print(f"[ERROR] API Error: {response.status_code}")
             return False
     except Exception as e:
         print(f"[ERROR] {e}")
@@ -1,25 +1,25 @@
-# utils.py  – revised
-import numpy as np
+# utils.py  – revised
 from collections import defaultdict
-from sklearn.cluster import KMeans
 import warnings
-from sklearn.exceptions import ConvergenceWarning
 
 try:
     import numpy as np
 except ImportError:
     print("[ERROR] numpy is not installed. Please install it with 'pip install numpy'.")
     np = None
-try:
-    from sklearn.cluster import KMeans
-    from sklearn.exceptions import ConvergenceWarning
-except ImportError:
-    print("[ERROR] scikit-learn is not installed. Please install it with 'pip install scikit-learn'.")
-    KMeans = None
-    ConvergenceWarning = None
+
+def _kmeans():
+    """Import scikit-learn's KMeans on first use; importing sklearn costs over a second at startup"""
+    try:
+        from sklearn.cluster import KMeans
+        from sklearn.exceptions import ConvergenceWarning
+    except ImportError:
+        print("[ERROR] scikit-learn is not installed. Please install it with 'pip install scikit-learn'.")
+        return None, None
+    return KMeans, ConvergenceWarning
 
 def extract_headings(doc):
-    if np is None or KMeans is None:
+    if np is None:
         return "Unknown Title", []
     line_rows = []          # (text, max_font_size, page_num)
     font_sizes = []         # list[float]
@@ -53,6 +53,9 @@ def extract_headings(doc):
                     return f"H{i+1}"
             return None
     else:
+        KMeans, ConvergenceWarning = _kmeans()
+        if KMeans is None:
+            return "Unknown Title", []
         # Use KMeans, but adapt cluster count to avoid the warning
         with warnings.catch_warnings():
             warnings.filterwarnings("ignore", category=ConvergenceWarning)
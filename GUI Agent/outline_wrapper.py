@@ -1,8 +1,6 @@
 import sys
 import os
 import json
-import fitz  
-from outline_extractor.utils import extract_headings
 
 def main():
     if len(sys.argv) < 2:
@@ -16,6 +14,9 @@ def main():
         sys.exit(1)
 
     try:
+        # imported only once the arguments are valid, to keep usage errors instant
+        import fitz
+        from outline_extractor.utils import extract_headings
         doc = fitz.open(pdf_path)
         title, outline = extract_headings(doc)
 
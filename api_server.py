@@ -4,106 +4,422 @@ import os
 import tempfile
 import shutil
 import json
+import functools
+import importlib
+import threading
+import zipfile
+from contextlib import contextmanager, ExitStack
 
 app = Flask(__name__)
 CORS(app)
 
-# Initialize spaCy processor
-try:
-    from spacy_multilingual_utils import initialize_spacy, get_spacy_processor
-    spacy_initialized = initialize_spacy()
-except ImportError as e:
-    print(f"[WARNING] spaCy not available: {e}")
-    spacy_initialized = False
-
 UPLOAD_FOLDER = tempfile.gettempdir()
+# Uploads up to this size are handed to the extractors as bytes; larger ones
+# are spilled to a private temporary file so they are not held in memory.
+UPLOAD_MEMORY_LIMIT = int(float(os.environ.get('PDF_UPLOAD_MEMORY_LIMIT_MB', '64')) * 1024 * 1024)
+MAX_TOP_K = int(os.environ.get('PDF_API_MAX_TOP_K', '100'))   # most ranked sections one request may ask for
 
-# Lazy imports to handle dependency issues
-def get_outline_extractor():
+@contextmanager
+def uploaded_pdf(upload):
+    """Yield an uploaded PDF as bytes, or as a temp file path if it is very large"""
+    stream = upload.stream
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+    if size <= UPLOAD_MEMORY_LIMIT:
+        yield stream.read()
+        return
+    fd, temp_pdf_path = tempfile.mkstemp(suffix='.pdf', dir=UPLOAD_FOLDER)
     try:
-        from outline_extractor.extractor import extract_outline_from_file
-        return extract_outline_from_file
-    except ImportError as e:
-        print(f"[WARNING] Outline extractor import failed: {e}")
-        return None
+        with os.fdopen(fd, 'wb') as f:
+            shutil.copyfileobj(stream, f)
+        yield temp_pdf_path
+    finally:
+        if os.path.exists(temp_pdf_path):
+            os.remove(temp_pdf_path)
+
+# Extraction endpoints share this many slots per worker process; further
+# requests wait up to PDF_API_QUEUE_TIMEOUT seconds, then get a 503.
+MAX_CONCURRENT_EXTRACTIONS = int(os.environ.get('PDF_API_MAX_CONCURRENCY', '4'))
+EXTRACTION_QUEUE_TIMEOUT = float(os.environ.get('PDF_API_QUEUE_TIMEOUT', '30'))
+_extraction_slots = threading.BoundedSemaphore(MAX_CONCURRENT_EXTRACTIONS)
+
+def limit_concurrency(view):
+    """Run the view only while holding one of the worker's extraction slots"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not _extraction_slots.acquire(timeout=EXTRACTION_QUEUE_TIMEOUT):
+            return jsonify({'error': 'Server busy, please retry later'}), 503
+        try:
+            return view(*args, **kwargs)
+        finally:
+            _extraction_slots.release()
+    return wrapper
+
+# Lazy imports to handle dependency issues; each extractor is imported once
+# per process and the outcome (function or None) is remembered.
+_extractors = {}
+_extractors_lock = threading.Lock()
+
+def _load_extractor(label, module_name, attr):
+    with _extractors_lock:
+        if label not in _extractors:
+            try:
+                _extractors[label] = getattr(importlib.import_module(module_name), attr)
+            except ImportError as e:
+                print(f"[WARNING] {label} extractor import failed: {e}")
+                _extractors[label] = None
+        return _extractors[label]
+
+def get_outline_extractor():
+    return _load_extractor('Outline', 'outline_extractor.extractor', 'extract_outline_from_file')
 
 def get_persona_extractor():
-    try:
-        from persona_insight_extractor.extractor_1b import extract_persona_insight_from_file
-        return extract_persona_insight_from_file
-    except ImportError as e:
-        print(f"[WARNING] Persona extractor import failed: {e}")
-        return None
+    return _load_extractor('Persona', 'persona_insight_extractor.extractor_1b', 'extract_persona_insight_from_file')
 
 def get_semantic_extractor():
-    try:
-        from semantic_outline_extractor.main import extract_semantic_outline_from_file
-        return extract_semantic_outline_from_file
-    except ImportError as e:
-        print(f"[WARNING] Semantic extractor import failed: {e}")
+    return _load_extractor('Semantic', 'semantic_outline_extractor.main', 'extract_semantic_outline_from_file')
+
+def get_spacy():
+    """The spaCy processor with its model loaded on first use, or None if spaCy is unavailable"""
+    with _extractors_lock:
+        if 'spaCy' not in _extractors:
+            try:
+                from spacy_multilingual_utils import initialize_spacy, get_spacy_processor
+                _extractors['spaCy'] = get_spacy_processor() if initialize_spacy() else None
+            except ImportError as e:
+                print(f"[WARNING] spaCy not available: {e}")
+                _extractors['spaCy'] = None
+        return _extractors['spaCy']
+
+def _load_sentence_model():
+    loader = _load_extractor('SBERT model', 'persona_insight_extractor.extractor_1b', 'get_sentence_model')
+    return loader() if loader else None
+
+def warm_extractors():
+    """Import every extractor and its models up front (run once per worker at startup)"""
+    status = {
+        'outline_extractor': get_outline_extractor() is not None,
+        'persona_extractor': get_persona_extractor() is not None,
+        'semantic_extractor': get_semantic_extractor() is not None,
+        'spacy_multilingual': get_spacy() is not None,
+        'sbert_model': _load_sentence_model() is not None,
+    }
+    get_job_queue()
+    print(f"[INFO] Worker {os.getpid()} ready: " +
+          ", ".join(f"{name}={'ok' if ok else 'unavailable'}" for name, ok in status.items()))
+    return status
+
+def _page_options(form):
+    """
+    Optional ``pages`` ("3-10") and ``max_headings`` form fields as extractor
+    keyword arguments; raises ValueError with a message for invalid values
+    """
+    from outline_extractor.layout_utils import parse_page_range
+
+    options = {}
+    if form.get('pages'):
+        try:
+            options['pages'] = parse_page_range(form['pages'])
+        except ValueError:
+            raise ValueError(f"Invalid pages: {form['pages']!r} (use e.g. '5', '3-10' or '30-')")
+    if form.get('max_headings'):
+        try:
+            max_headings = int(form['max_headings'])
+        except ValueError:
+            max_headings = 0
+        if max_headings < 1:
+            raise ValueError('max_headings must be a positive integer')
+        options['max_headings'] = max_headings
+    return options
+
+def _page_range_error(source, options):
+    """Message if the requested page range starts past the end of the PDF, else None"""
+    if 'pages' not in options:
         return None
+    from outline_extractor.layout_utils import open_pdf
+
+    doc = open_pdf(source)
+    try:
+        page_count = len(doc)
+    finally:
+        doc.close()
+    first = options['pages'][0]
+    if first > page_count:
+        return f'Page {first} is past the end of the document ({page_count} pages)'
+    return None
 
 @app.route('/api/outline', methods=['POST'])
+@limit_concurrency
 def extract_outline():
     if 'pdf' not in request.files:
         return jsonify({'error': 'No PDF uploaded'}), 400
     pdf = request.files['pdf']
-    temp_pdf_path = os.path.join(UPLOAD_FOLDER, pdf.filename)
-    pdf.save(temp_pdf_path)
+    try:
+        options = _page_options(request.form)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     try:
         extractor = get_outline_extractor()
         if not extractor:
             return jsonify({'error': 'Outline extractor not available on server (missing dependencies)'}), 503
-        result = extractor(temp_pdf_path)
+        with uploaded_pdf(pdf) as source:
+            error = _page_range_error(source, options)
+            if error:
+                return jsonify({'error': error}), 400
+            result = extractor(source, **options)
         return jsonify(result)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-    finally:
-        if os.path.exists(temp_pdf_path):
-            os.remove(temp_pdf_path)
 
 @app.route('/api/persona', methods=['POST'])
+@limit_concurrency
 def extract_persona():
     if 'pdf' not in request.files or 'persona' not in request.form:
         return jsonify({'error': 'PDF and persona required'}), 400
     pdf = request.files['pdf']
-    persona_json = request.form['persona']
     try:
-        persona = json.loads(persona_json)
-    except Exception:
-        return jsonify({'error': 'Invalid persona JSON'}), 400
-    temp_pdf_path = os.path.join(UPLOAD_FOLDER, pdf.filename)
-    pdf.save(temp_pdf_path)
+        persona = _persona(request.form['persona'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     try:
         extractor = get_persona_extractor()
         if not extractor:
             return jsonify({'error': 'Persona extractor not available on server (missing dependencies)'}), 503
-        result = extractor(temp_pdf_path, persona)
+        with uploaded_pdf(pdf) as source:
+            result = extractor(source, persona, filename=os.path.basename(pdf.filename or 'document.pdf'))
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _persona(value):
+    """Parse and check a persona (JSON text or object); raises ValueError with a message"""
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            raise ValueError('Invalid persona JSON')
+    if not isinstance(value, dict):
+        raise ValueError('Persona JSON must be an object with "persona" and "job_to_be_done"')
+    missing = [f'"{field}"' for field in ('persona', 'job_to_be_done') if field not in value]
+    if missing:
+        raise ValueError(f"Persona JSON is missing {' and '.join(missing)}")
+    return value
+
+def _top_k(value):
+    """Validate a requested ``top_k``; raises ValueError with a message"""
+    try:
+        top_k = int(value)
+    except (TypeError, ValueError):
+        top_k = 0
+    if isinstance(value, bool) or (isinstance(value, float) and value != top_k):
+        top_k = 0                               # true or 2.5 from a JSON body
+    if not 1 <= top_k <= MAX_TOP_K:
+        raise ValueError(f'top_k must be an integer between 1 and {MAX_TOP_K}')
+    return top_k
+
+def get_persona_batch_extractor():
+    return _load_extractor('Persona batch', 'persona_insight_extractor.extractor_1b', 'extract_persona_insight_from_files')
+
+def _archive_pdfs(archive):
+    """Yield (path inside the archive, bytes) for every PDF inside an uploaded zip archive"""
+    with zipfile.ZipFile(archive.stream) as zf:
+        for info in zf.infolist():
+            if info.is_dir() or not info.filename.lower().endswith('.pdf'):
+                continue
+            if info.file_size > UPLOAD_MEMORY_LIMIT:
+                raise ValueError(f'{info.filename} is larger than the per-file upload limit')
+            # the full path keeps a/doc1.pdf and b/doc1.pdf apart in the results
+            yield info.filename, zf.read(info)
+
+@app.route('/api/persona/batch', methods=['POST'])
+@limit_concurrency
+def extract_persona_batch():
+    """Rank sections across many PDFs (files under 'pdfs' and/or a zip 'archive') in one pass"""
+    pdfs = request.files.getlist('pdfs')
+    archive = request.files.get('archive')
+    if (not pdfs and archive is None) or 'persona' not in request.form:
+        return jsonify({'error': "PDFs ('pdfs' files or a zip 'archive') and persona required"}), 400
+    try:
+        persona = _persona(request.form['persona'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        top_k = _top_k(request.form.get('top_k', 10))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        extractor = get_persona_batch_extractor()
+        if not extractor:
+            return jsonify({'error': 'Persona extractor not available on server (missing dependencies)'}), 503
+        with ExitStack() as stack:
+            documents = [
+                (os.path.basename(pdf.filename or f'document_{i + 1}.pdf'), stack.enter_context(uploaded_pdf(pdf)))
+                for i, pdf in enumerate(pdfs)
+            ]
+            if archive is not None:
+                try:
+                    documents.extend(_archive_pdfs(archive))
+                except (zipfile.BadZipFile, ValueError) as e:
+                    return jsonify({'error': f'Invalid archive: {e}'}), 400
+            if not documents:
+                return jsonify({'error': 'No PDF files found in upload'}), 400
+            result = extractor(documents, persona, top_k=top_k)
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def get_persona_corpus_search():
+    return _load_extractor('Persona corpus search', 'persona_insight_extractor.extractor_1b', 'search_corpus')
+
+@app.route('/api/persona/search', methods=['POST'])
+@limit_concurrency
+def search_persona_corpus():
+    """Rank sections across every document already processed by the persona extractors"""
+    data = request.get_json(silent=True)
+    if not data or 'persona' not in data:
+        return jsonify({'error': 'Persona required'}), 400
+    try:
+        persona = _persona(data['persona'])
+        top_k = _top_k(data.get('top_k', 10))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        search = get_persona_corpus_search()
+        if not search:
+            return jsonify({'error': 'Persona extractor not available on server (missing dependencies)'}), 503
+        result = search(persona, top_k=top_k)
         return jsonify(result)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-    finally:
-        if os.path.exists(temp_pdf_path):
-            os.remove(temp_pdf_path)
 
 @app.route('/api/semantic-outline', methods=['POST'])
+@limit_concurrency
 def extract_semantic_outline():
     if 'pdf' not in request.files:
         return jsonify({'error': 'No PDF uploaded'}), 400
     pdf = request.files['pdf']
-    temp_pdf_path = os.path.join(UPLOAD_FOLDER, pdf.filename)
-    pdf.save(temp_pdf_path)
+    try:
+        options = _page_options(request.form)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     try:
         extractor = get_semantic_extractor()
         if not extractor:
             return jsonify({'error': 'Semantic outline extractor not available on server (missing dependencies)'}), 503
-        result = extractor(temp_pdf_path)
+        with uploaded_pdf(pdf) as source:
+            error = _page_range_error(source, options)
+            if error:
+                return jsonify({'error': error}), 400
+            result = extractor(source, **options)
         return jsonify(result)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-    finally:
-        if os.path.exists(temp_pdf_path):
-            os.remove(temp_pdf_path)
+
+# ---------- Asynchronous jobs ----------
+def _check_page_range(pdf_path, params):
+    """Fail a job whose page range starts past the end as a client error (400 from /result)"""
+    error = _page_range_error(pdf_path, params or {})
+    if error:
+        from outline_extractor.layout_utils import PageRangeError
+        raise PageRangeError(error)
+
+def _outline_job(pdf_path, params, filename):
+    extractor = get_outline_extractor()
+    if not extractor:
+        return {'error': 'Outline extractor not available on server (missing dependencies)'}
+    _check_page_range(pdf_path, params)
+    return extractor(pdf_path, **(params or {}))
+
+def _persona_job(pdf_path, params, filename):
+    extractor = get_persona_extractor()
+    if not extractor:
+        return {'error': 'Persona extractor not available on server (missing dependencies)'}
+    return extractor(pdf_path, params, filename=filename)
+
+def _semantic_job(pdf_path, params, filename):
+    extractor = get_semantic_extractor()
+    if not extractor:
+        return {'error': 'Semantic outline extractor not available on server (missing dependencies)'}
+    _check_page_range(pdf_path, params)
+    return extractor(pdf_path, **(params or {}))
+
+JOB_HANDLERS = {
+    'outline': _outline_job,
+    'persona': _persona_job,
+    'semantic-outline': _semantic_job,
+}
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+def get_job_queue():
+    """Create and start this process's job queue worker on first use"""
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            from job_queue import JobQueue
+            _job_queue = JobQueue(JOB_HANDLERS)
+            _job_queue.start()
+        return _job_queue
+
+@app.route('/api/jobs/<kind>', methods=['POST'])
+def submit_job(kind):
+    """Queue a PDF for extraction and return a job id to poll"""
+    if kind not in JOB_HANDLERS:
+        return jsonify({'error': f'Unknown job type: {kind}'}), 404
+    if 'pdf' not in request.files:
+        return jsonify({'error': 'No PDF uploaded'}), 400
+    params = None
+    if kind == 'persona':
+        if 'persona' not in request.form:
+            return jsonify({'error': 'PDF and persona required'}), 400
+        try:
+            params = _persona(request.form['persona'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    else:
+        try:
+            params = _page_options(request.form) or None
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    pdf = request.files['pdf']
+    try:
+        job_id = get_job_queue().submit(kind, pdf.stream, params,
+                                        filename=os.path.basename(pdf.filename or 'document.pdf'))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    return jsonify({
+        'job_id': job_id,
+        'status': 'queued',
+        'status_url': f'/api/jobs/{job_id}',
+        'result_url': f'/api/jobs/{job_id}/result'
+    }), 202
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Status and page progress of a queued job"""
+    status = get_job_queue().status(job_id)
+    if status is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(status)
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    """Final JSON of a finished job (202 while it is still running)"""
+    status, result, error, error_kind = get_job_queue().result(job_id)
+    if status is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    if status == 'done':
+        return jsonify(result)
+    if status == 'failed':
+        return jsonify({'error': error}), 400 if error_kind == 'client' else 500
+    return jsonify({'job_id': job_id, 'status': status}), 202
+
+def _spacy_status():
+    # reported without loading spaCy, which only happens on first use
+    if 'spaCy' not in _extractors:
+        return 'not loaded'
+    return 'available' if _extractors['spaCy'] else 'unavailable'
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
@@ -112,13 +428,28 @@ def health_check():
         'outline_extractor': 'available' if get_outline_extractor() else 'unavailable',
         'persona_extractor': 'available' if get_persona_extractor() else 'unavailable', 
         'semantic_extractor': 'available' if get_semantic_extractor() else 'unavailable',
-        'spacy_multilingual': 'available' if spacy_initialized else 'unavailable'
+        'spacy_multilingual': _spacy_status(),
+        'spacy_models': _extractors['spaCy'].pool.stats() if _extractors.get('spaCy') else None
     })
 
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """Hit/miss counters and size of the extraction result cache"""
+    try:
+        from outline_extractor.cache_utils import get_result_cache
+    except ImportError as e:
+        return jsonify({'error': f'Result cache not available: {e}'}), 503
+    cache = get_result_cache()
+    if cache is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **cache.stats()})
+
 @app.route('/api/spacy/analyze', methods=['POST'])
+@limit_concurrency
 def spacy_analyze():
     """Analyze text using spaCy multilingual features"""
-    if not spacy_initialized:
+    processor = get_spacy()
+    if processor is None:
         return jsonify({'error': 'spaCy not available'}), 503
     
     data = request.get_json()
@@ -126,29 +457,20 @@ def spacy_analyze():
         return jsonify({'error': 'Text required'}), 400
     
     text = data['text']
-    processor = get_spacy_processor()
-    
     try:
-        # Perform comprehensive analysis
-        analysis = processor.analyze_text_structure(text)
-        entities = processor.extract_entities(text)
-        key_phrases = processor.extract_key_phrases(text)
-        
-        result = {
-            'analysis': analysis,
-            'entities': entities,
-            'key_phrases': key_phrases,
-            'language_detected': analysis['language']
-        }
+        # Perform comprehensive analysis from a single parse
+        result = processor.analyze(text)
         
         return jsonify(result)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/spacy/search', methods=['POST'])
+@limit_concurrency
 def spacy_search():
     """Multilingual search using spaCy"""
-    if not spacy_initialized:
+    processor = get_spacy()
+    if processor is None:
         return jsonify({'error': 'spaCy not available'}), 503
     
     data = request.get_json()
@@ -159,8 +481,6 @@ def spacy_search():
     sections = data['sections']
     top_k = data.get('top_k', 5)
     
-    processor = get_spacy_processor()
-    
     try:
         results = processor.multilingual_search(query, sections, top_k)
         return jsonify({'results': results})
@@ -168,9 +488,11 @@ def spacy_search():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/spacy/entities', methods=['POST'])
+@limit_concurrency
 def spacy_entities():
     """Extract named entities from text"""
-    if not spacy_initialized:
+    processor = get_spacy()
+    if processor is None:
         return jsonify({'error': 'spaCy not available'}), 503
     
     data = request.get_json()
@@ -178,8 +500,6 @@ def spacy_entities():
         return jsonify({'error': 'Text required'}), 400
     
     text = data['text']
-    processor = get_spacy_processor()
-    
     try:
         entities = processor.extract_entities(text)
         return jsonify({'entities': entities})
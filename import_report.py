@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Import-time report for the API server and the command-line extractors.
+
+Each entry point is imported in a fresh interpreter with ``python -X
+importtime``, the way the GUI launches it, and the report lists its total
+cold import time plus the slowest top-level packages it pulled in.  Heavy
+libraries (spaCy, transformers, sentence-transformers, scikit-learn,
+PyMuPDF) are meant to load on first use, so they should not show up here.
+
+Usage:
+    python import_report.py                     # report every entry point
+    python import_report.py --budget-ms 800     # exit 1 if one is slower
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# (label, working directory, module)
+ENTRY_POINTS = [
+    ("api_server", ROOT, "api_server"),
+    ("outline extractor", ROOT, "outline_extractor.extractor"),
+    ("persona extractor", ROOT, "persona_insight_extractor.extractor_1b"),
+    ("semantic extractor", ROOT, "semantic_outline_extractor.main"),
+    ("watch folder", ROOT, "watch_folder"),
+    ("GUI outline extractor", os.path.join(ROOT, "GUI Agent"), "outline_extractor.utils"),
+]
+# must not be imported by any entry point
+DEFERRED = ("spacy", "transformers", "sentence_transformers", "torch", "sklearn", "fitz")
+
+
+def measure(cwd, module):
+    """Return ``(total µs, {top-level package: µs})`` for one cold import."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "import failed")
+    packages = defaultdict(int)
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_time, _, name = line[len("import time:"):].split("|")
+        if not self_time.strip().isdigit():
+            continue                                  # the header line
+        # each module's own time, summed per top-level package
+        packages[name.strip().split(".")[0]] += int(self_time)
+    total = sum(packages.values())
+    return total, packages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report cold-start import times of the extractors.")
+    parser.add_argument("--top", type=int, default=5, help="slowest packages listed per entry point (default 5)")
+    parser.add_argument("--budget-ms", type=float, default=None,
+                        help="fail if any entry point takes longer than this to import")
+    args = parser.parse_args()
+
+    failed = False
+    for label, cwd, module in ENTRY_POINTS:
+        try:
+            total, packages = measure(cwd, module)
+        except RuntimeError as e:
+            print(f"[WARNING] {label}: {e}")
+            continue
+        print(f"{label:<22} {total / 1000:8.1f} ms")
+        for name, micros in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+            print(f"    {name:<30} {micros / 1000:8.1f} ms")
+        eager = sorted(name for name in packages if name in DEFERRED)
+        if eager:
+            print(f"[WARNING] {label} imports {', '.join(eager)} at startup")
+            failed = True
+        if args.budget_ms is not None and total / 1000 > args.budget_ms:
+            print(f"[ERROR] {label} exceeds the import budget of {args.budget_ms:.0f} ms")
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""
+SQLite-backed job queue for long-running PDF extractions.
+
+Jobs are stored in a local SQLite database next to their uploaded PDF, so
+every API worker process shares one queue without an external broker.  Each
+process runs a small thread pool that claims queued jobs, reports page
+progress while the document is parsed and stores the final JSON result.
+A heartbeat keeps running jobs fresh even while they report no progress,
+so only jobs whose process died are handed to another worker.
+"""
+
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+JOBS_DIR = os.environ.get(
+    "PDF_JOBS_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "pdf_intelligence", "jobs"),
+)
+JOB_WORKERS = int(os.environ.get("PDF_JOB_WORKERS", "2"))
+JOB_RETENTION_HOURS = float(os.environ.get("PDF_JOB_RETENTION_HOURS", "24"))
+STALE_JOB_SECONDS = 600         # running jobs without a heartbeat are re-queued
+HEARTBEAT_INTERVAL = 30         # seconds between heartbeats of running jobs
+PROGRESS_INTERVAL = 0.5         # seconds between progress writes
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          TEXT PRIMARY KEY,
+    kind        TEXT NOT NULL,
+    params      TEXT,
+    filename    TEXT,
+    status      TEXT NOT NULL,
+    pages_done  INTEGER NOT NULL DEFAULT 0,
+    pages_total INTEGER NOT NULL DEFAULT 0,
+    result      TEXT,
+    error       TEXT,
+    error_kind  TEXT,
+    claim       TEXT,
+    created_at  REAL NOT NULL,
+    updated_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+"""
+
+
+class JobQueue:
+    """Persistent queue of extraction jobs processed by a local thread pool."""
+
+    def __init__(self, handlers, directory=JOBS_DIR, workers=JOB_WORKERS, poll_interval=1.0):
+        # handlers: kind -> callable(pdf_path, params, filename) returning a result dict
+        self.handlers = handlers
+        self.directory = directory
+        self.upload_dir = os.path.join(directory, "uploads")
+        self.db_path = os.path.join(directory, "jobs.sqlite3")
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._slots = threading.Semaphore(workers)
+        self._active = {}           # job id -> claim of the jobs running here
+        self._active_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._executor = None
+        self._started = False
+        self._start_lock = threading.Lock()
+        os.makedirs(self.upload_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column in ("claim", "error_kind"):      # databases created before they existed
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} TEXT")
+
+    @contextmanager
+    def _connect(self):
+        """Yield a connection that commits on success and is always closed."""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _upload_path(self, job_id):
+        return os.path.join(self.upload_dir, f"{job_id}.pdf")
+
+    # ---------- public API ----------
+    def start(self):
+        with self._start_lock:
+            if self._started:
+                return
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="pdf-job")
+            threading.Thread(target=self._dispatch_loop, name="pdf-job-dispatcher", daemon=True).start()
+            threading.Thread(target=self._heartbeat_loop, name="pdf-job-heartbeat", daemon=True).start()
+            self._started = True
+
+    def submit(self, kind, stream, params=None, filename=None):
+        """Store the PDF read from ``stream`` and queue a job; return its id."""
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job_id = uuid.uuid4().hex
+        with open(self._upload_path(job_id), "wb") as f:
+            shutil.copyfileobj(stream, f)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, params, filename, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, 'queued', ?, ?)",
+                (job_id, kind, json.dumps(params), filename, now, now),
+            )
+        self.start()
+        self._wakeup.set()
+        return job_id
+
+    def status(self, job_id):
+        """Return the job's state without its result, or None if unknown."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT id, kind, filename, status, pages_done, pages_total, error, created_at, updated_at "
+                "FROM jobs WHERE id = ?", (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "job_id": row["id"],
+            "kind": row["kind"],
+            "filename": row["filename"],
+            "status": row["status"],
+            "progress": {"pages_done": row["pages_done"], "pages_total": row["pages_total"]},
+            "error": row["error"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
+
+    def result(self, job_id):
+        """
+        Return ``(status, result, error, error kind)`` from one lookup; result
+        is None until the job is done, and a failed job has an error whose
+        kind is "client" (bad request, e.g. pages past the end) or "server".
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT status, result, error, error_kind FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None, None, None, None
+        result = json.loads(row["result"]) if row["result"] else None
+        error_kind = row["error_kind"] or ("server" if row["error"] else None)   # rows from before error_kind
+        return row["status"], result, row["error"], error_kind
+
+    # ---------- worker side ----------
+    def _claim_next(self):
+        """Claim the oldest queued job; returns ``(job id, claim)`` or None."""
+        claim = uuid.uuid4().hex
+        with self._connect() as conn:
+            while True:
+                row = conn.execute(
+                    "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    return None
+                claimed = conn.execute(
+                    "UPDATE jobs SET status = 'running', claim = ?, updated_at = ? WHERE id = ? AND status = 'queued'",
+                    (claim, time.time(), row["id"]),
+                ).rowcount
+                conn.commit()
+                if claimed:         # another process may have taken it first
+                    return row["id"], claim
+
+    def _dispatch_loop(self):
+        last_cleanup = 0.0
+        while True:
+            acquired, job_id = False, None
+            try:
+                if time.time() - last_cleanup > 60:
+                    self._requeue_stale()
+                    self._cleanup()
+                    last_cleanup = time.time()
+                self._slots.acquire()
+                acquired = True
+                claimed = self._claim_next()
+                if claimed is None:
+                    self._slots.release()
+                    acquired = False
+                    self._wakeup.wait(self.poll_interval)
+                    self._wakeup.clear()
+                    continue
+                job_id, claim = claimed
+                with self._active_lock:
+                    self._active[job_id] = claim
+                self._executor.submit(self._run, job_id, claim)
+            except Exception as e:
+                # e.g. "database is locked": keep dispatching; a job claimed
+                # but not started gets no heartbeat and is re-queued as stale
+                print(f"[WARNING] Job dispatch failed: {e}")
+                if job_id is not None:
+                    with self._active_lock:
+                        self._active.pop(job_id, None)
+                if acquired:
+                    self._slots.release()
+                time.sleep(self.poll_interval)
+
+    def _heartbeat_loop(self):
+        """Refresh ``updated_at`` of the jobs running here, progress or not"""
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL)
+            with self._active_lock:
+                active = list(self._active.items())
+            if not active:
+                continue
+            try:
+                with self._connect() as conn:
+                    conn.executemany(
+                        "UPDATE jobs SET updated_at = ? WHERE id = ? AND claim = ? AND status = 'running'",
+                        [(time.time(), job_id, claim) for job_id, claim in active],
+                    )
+            except sqlite3.Error as e:
+                print(f"[WARNING] Job heartbeat failed: {e}")
+
+    def _update(self, job_id, claim, **fields):
+        """Update a job this worker still holds; returns False if it was claimed again."""
+        fields["updated_at"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._connect() as conn:
+            return conn.execute(
+                f"UPDATE jobs SET {columns} WHERE id = ? AND claim = ?", (*fields.values(), job_id, claim)
+            ).rowcount > 0
+
+    def _run(self, job_id, claim):
+        from outline_extractor.layout_utils import PageRangeError, report_progress
+
+        owned = True
+        try:
+            with self._connect() as conn:
+                row = conn.execute("SELECT kind, params, filename FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            last_write = [0.0]
+
+            def on_page(pages_done, pages_total):
+                now = time.time()
+                if pages_done == pages_total or now - last_write[0] >= PROGRESS_INTERVAL:
+                    last_write[0] = now
+                    self._update(job_id, claim, pages_done=pages_done, pages_total=pages_total)
+
+            handler = self.handlers[row["kind"]]
+            with report_progress(on_page):
+                result = handler(self._upload_path(job_id), json.loads(row["params"]), row["filename"])
+            if isinstance(result, dict) and "error" in result:
+                owned = self._update(job_id, claim, status="failed", error=str(result["error"]), error_kind="server")
+            else:
+                owned = self._update(job_id, claim, status="done", result=json.dumps(result))
+        except Exception as e:
+            # only known at parse time (the page count), so reported with the result
+            error_kind = "client" if isinstance(e, PageRangeError) else "server"
+            try:
+                owned = self._update(job_id, claim, status="failed", error=str(e), error_kind=error_kind)
+            except sqlite3.Error:
+                pass
+        finally:
+            with self._active_lock:
+                self._active.pop(job_id, None)
+            # a job claimed again by another worker still needs its upload
+            if owned:
+                try:
+                    os.remove(self._upload_path(job_id))
+                except OSError:
+                    pass
+            self._slots.release()
+
+    def _requeue_stale(self):
+        cutoff = time.time() - STALE_JOB_SECONDS
+        with self._connect() as conn:
+            for row in conn.execute(
+                "SELECT id FROM jobs WHERE status = 'running' AND updated_at < ?", (cutoff,)
+            ).fetchall():
+                if os.path.exists(self._upload_path(row["id"])):
+                    conn.execute(
+                        "UPDATE jobs SET status = 'queued', updated_at = ? WHERE id = ? AND status = 'running'",
+                        (time.time(), row["id"]),
+                    )
+                else:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'failed', error = 'Worker stopped before finishing', "
+                        "error_kind = 'server' WHERE id = ?",
+                        (row["id"],),
+                    )
+
+    def _cleanup(self):
+        cutoff = time.time() - JOB_RETENTION_HOURS * 3600
+        with self._connect() as conn:
+            conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?", (cutoff,))
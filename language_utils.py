@@ -0,0 +1,184 @@
+"""
+Script-based language detection in a single pass.
+
+The text is sampled (a few windows spread over it, bounded in size),
+converted to code points and binned against one precompiled table of
+Unicode blocks and marker letters in a single vectorised lookup.  Latin
+text is split between languages by their marker letters and common
+function words.  The result is a list of ranked language guesses with a
+confidence (the share of letters voting for each language), which is cheap
+enough to run per section and route multilingual PDFs to the right model.
+"""
+
+import re
+
+import numpy as np
+
+SAMPLE_CHARS = 3000       # at most this many characters are inspected
+SAMPLE_WINDOWS = 3        # spread over the start, middle and end of the text
+
+# (first code point, last code point, bin)
+_RANGES = [
+    (0x41, 0x5A, "latin"), (0x61, 0x7A, "latin"),
+    (0xC0, 0xD6, "latin"), (0xD8, 0xF6, "latin"), (0xF8, 0x24F, "latin"),
+    (0x370, 0x3FF, "greek"), (0x1F00, 0x1FFF, "greek"),
+    (0x400, 0x52F, "cyrillic"),
+    (0x530, 0x58F, "armenian"),
+    (0x590, 0x5FF, "hebrew"),
+    (0x600, 0x6FF, "arabic"), (0x750, 0x77F, "arabic"), (0xFB50, 0xFDFF, "arabic"), (0xFE70, 0xFEFF, "arabic"),
+    (0x900, 0x97F, "devanagari"),
+    (0x980, 0x9FF, "bengali"),
+    (0xE00, 0xE7F, "thai"),
+    (0x1100, 0x11FF, "hangul"), (0x3130, 0x318F, "hangul"), (0xAC00, 0xD7AF, "hangul"),
+    (0x3040, 0x309F, "kana"), (0x30A0, 0x30FF, "kana"), (0xFF66, 0xFF9F, "kana"),
+    (0x3400, 0x4DBF, "han"), (0x4E00, 0x9FFF, "han"), (0xF900, 0xFAFF, "han"),
+]
+
+# Latin letters characteristic of one language (lower and upper case)
+_LATIN_MARKERS = {
+    "german": "äöüß",
+    "spanish": "ñáíóú¿¡",
+    "french": "àâçèêëîïôœùûÿé",
+    "portuguese": "ãõ",
+    "polish": "ąćęłńśźż",
+    "czech": "čďěňřšťůž",
+    "turkish": "ğış",
+    "scandinavian": "åæø",
+}
+
+# frequent function words of Latin-script languages
+_FUNCTION_WORDS = {
+    "english": "the and of to is that with for this are was we you it on be not have",
+    "german": "der die und das ist nicht mit den von ein eine zu auf für sich dem des auch",
+    "spanish": "el los las del que y es por para una con se como pero su al lo",
+    "french": "le les des et est une du que pour dans pas sur avec ce il qui au",
+    "portuguese": "os da do das dos não em uma com para que ao pelo",
+    "polish": "nie się jest na że jak ale",
+    "czech": "je se na že jak ale jsou",
+    "turkish": "bir ve bu da de için ile olarak",
+    "scandinavian": "og er det til som med af på",
+}
+_FUNCTION_WORD_LANGUAGES = {}
+for _lang, _words in _FUNCTION_WORDS.items():
+    for _word in _words.split():
+        _FUNCTION_WORD_LANGUAGES.setdefault(_word, []).append(_lang)
+_WORD_RE = re.compile(r"[^\W\d_]+")
+
+# single-script languages
+_SCRIPT_LANGUAGES = {
+    "greek": "greek",
+    "cyrillic": "russian",
+    "armenian": "armenian",
+    "hebrew": "hebrew",
+    "arabic": "arabic",
+    "devanagari": "hindi",
+    "bengali": "bengali",
+    "thai": "thai",
+    "hangul": "korean",
+}
+
+LANGUAGE_CODES = {
+    "english": "en", "german": "de", "spanish": "es", "french": "fr",
+    "portuguese": "pt", "polish": "pl", "czech": "cs", "turkish": "tr",
+    "scandinavian": "da", "greek": "el", "russian": "ru", "armenian": "hy",
+    "hebrew": "he", "arabic": "ar", "hindi": "hi", "bengali": "bn",
+    "thai": "th", "korean": "ko", "japanese": "ja", "chinese": "zh",
+}
+
+
+def _compile_table():
+    """Sorted bin boundaries for np.searchsorted; marker letters get their own bins"""
+    bins = ["other"] + sorted({name for _, _, name in _RANGES}) + [f"marker:{lang}" for lang in _LATIN_MARKERS]
+    bin_ids = {name: i for i, name in enumerate(bins)}
+    points = [(start, end, bin_ids[name]) for start, end, name in _RANGES]
+    for lang, letters in _LATIN_MARKERS.items():
+        # upper-case forms only where they are distinct single letters ('ß' -> 'SS', 'ı' -> 'I')
+        upper = [ch.upper() for ch in letters if len(ch.upper()) == 1 and ord(ch.upper()) > 0x7F]
+        for ch in set(letters) | set(upper):
+            points.append((ord(ch), ord(ch), bin_ids[f"marker:{lang}"]))
+    # marker code points split the Latin ranges they sit in
+    boundaries = {0}
+    for start, end, _ in points:
+        boundaries.update((start, end + 1))
+    starts = np.array(sorted(boundaries), dtype=np.uint32)
+    labels = np.zeros(len(starts), dtype=np.int64)
+    for start, end, bin_id in sorted(points, key=lambda p: p[1] - p[0], reverse=True):
+        # narrower entries (markers) are written last and win
+        lo, hi = np.searchsorted(starts, [start, end + 1])
+        labels[lo:hi] = bin_id
+    return starts, labels, bins
+
+
+_STARTS, _LABELS, _BINS = _compile_table()
+
+
+def _sample(text, sample_chars=SAMPLE_CHARS):
+    if len(text) <= sample_chars:
+        return text
+    window = sample_chars // SAMPLE_WINDOWS
+    step = (len(text) - window) / (SAMPLE_WINDOWS - 1)
+    return "".join(text[int(i * step):int(i * step) + window] for i in range(SAMPLE_WINDOWS))
+
+
+def script_histogram(text, sample_chars=SAMPLE_CHARS):
+    """Letter counts per script/marker bin over a bounded sample of ``text``."""
+    return _histogram(_sample(text, sample_chars))
+
+
+def _histogram(sample):
+    codes = np.frombuffer(sample.encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+    counts = np.bincount(_LABELS[np.searchsorted(_STARTS, codes, side="right") - 1], minlength=len(_BINS))
+    return {name: int(count) for name, count in zip(_BINS, counts) if count and name != "other"}
+
+
+def detect_languages(text, top_n=3, sample_chars=SAMPLE_CHARS):
+    """
+    Ranked language guesses for ``text`` as ``[{"language", "code",
+    "confidence"}, ...]`` (best first); empty when the text has no letters.
+    """
+    sample = _sample(text, sample_chars)
+    hist = _histogram(sample)
+    scores = {}
+    for script, language in _SCRIPT_LANGUAGES.items():
+        if script in hist:
+            scores[language] = hist[script]
+
+    # Han is shared: kana decides between Japanese and Chinese
+    kana, han = hist.get("kana", 0), hist.get("han", 0)
+    if kana and kana >= 0.05 * (kana + han):
+        scores["japanese"] = kana + han
+    else:
+        if kana:
+            scores["japanese"] = kana
+        if han:
+            scores["chinese"] = han
+
+    # Latin letters are shared out by evidence: marker letters plus
+    # function words; Latin text without any evidence counts as English
+    markers = {lang: hist.get(f"marker:{lang}", 0) for lang in _LATIN_MARKERS}
+    latin = hist.get("latin", 0) + sum(markers.values())
+    if latin:
+        evidence = {lang: count for lang, count in markers.items() if count}
+        for word in _WORD_RE.findall(sample.lower()):
+            for lang in _FUNCTION_WORD_LANGUAGES.get(word, ()):
+                evidence[lang] = evidence.get(lang, 0) + 1
+        total_evidence = sum(evidence.values())
+        if not total_evidence:
+            evidence, total_evidence = {"english": 1}, 1
+        for lang, count in evidence.items():
+            scores[lang] = latin * count / total_evidence
+
+    total = sum(scores.values())
+    if not total:
+        return []
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_n]
+    return [
+        {"language": language, "code": LANGUAGE_CODES.get(language), "confidence": round(score / total, 3)}
+        for language, score in ranked
+    ]
+
+
+def detect_language(text, default="english"):
+    """The most likely language of ``text`` (``default`` when it has no letters)."""
+    guesses = detect_languages(text, top_n=1)
+    return guesses[0]["language"] if guesses else default
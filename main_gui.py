@@ -518,7 +518,7 @@ This application provides three different PDF extraction methods:\n\n1. Outline
                     queue_.put(('log', "No sections extracted from PDFs.\n"))
                     queue_.put(('done', None))
                     return
-                ranked = rank_sections_by_similarity(all_sections, combined_query)
+                ranked = rank_sections_by_similarity(all_sections, combined_query, model, top_k=10)
                 # Show full summary/text for each section
                 queue_.put(('log', f"Persona: {persona}\n"))
                 queue_.put(('log', f"Job: {job}\n\n"))
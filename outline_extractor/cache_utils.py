@@ -0,0 +1,183 @@
+# cache_utils.py
+"""
+On-disk result cache for the outline, semantic and persona extractors.
+
+Results are stored as JSON files named after a hash of the PDF's content,
+the extractor name, its version and its parameters, so a repeat upload of
+the same document is answered without parsing it again.  The directory is
+bounded in size and evicts the least recently used entries first (entry
+mtimes are bumped on every hit).
+"""
+import hashlib
+import json
+import os
+import threading
+
+CACHE_DIR = os.environ.get(
+    "PDF_RESULT_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "pdf_intelligence", "results"),
+)
+CACHE_MAX_MB = float(os.environ.get("PDF_RESULT_CACHE_MAX_MB", "256"))
+CACHE_ENABLED = os.environ.get("PDF_RESULT_CACHE", "1") != "0"
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """Return the SHA-256 hex digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def content_hash(source):
+    """Return the SHA-256 hex digest of a PDF given as a path or as bytes."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(source).hexdigest()
+    return file_hash(source)
+
+
+class ResultCache:
+    """Size-bounded LRU cache of extraction results kept as JSON files."""
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=int(CACHE_MAX_MB * 1024 * 1024)):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._bytes = None          # lazily measured on first write
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def make_key(content_hash, extractor, version, params=None):
+        payload = json.dumps([content_hash, extractor, version, params], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                result = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return result
+
+    def put(self, key, result):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        size = os.path.getsize(tmp_path)
+        with self._lock:
+            try:
+                replaced = os.path.getsize(path)    # a recomputed result overwrites its entry
+            except OSError:
+                replaced = 0
+            os.replace(tmp_path, path)
+            if self._bytes is None:
+                self._bytes = self._scan()[1]
+            else:
+                self._bytes += size - replaced
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def _scan(self):
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+        return entries, total
+
+    def _evict(self):
+        entries, total = self._scan()
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._bytes = total
+
+    def clear(self):
+        with self._lock:
+            for _, _, path in self._scan()[0]:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            entries, total = self._scan()
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(entries),
+                "bytes": total,
+                "max_bytes": self.max_bytes,
+            }
+
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    """Return the process-wide ResultCache, or None if caching is disabled."""
+    global _result_cache
+    if not CACHE_ENABLED:
+        return None
+    with _result_cache_lock:
+        if _result_cache is None:
+            try:
+                _result_cache = ResultCache()
+            except OSError as e:
+                print(f"[WARNING] Result cache unavailable: {e}")
+                return None
+        return _result_cache
+
+
+def cached_extraction(source, extractor, version, params, compute, use_cache=True):
+    """
+    Return ``compute()`` for the PDF ``source`` (path or bytes), reusing a
+    cached result when the same content was already processed by the same
+    extractor version and parameters.  Results carrying an ``"error"`` key
+    are never cached.
+    """
+    cache = get_result_cache() if use_cache else None
+    if cache is None:
+        return compute()
+    try:
+        key = cache.make_key(content_hash(source), extractor, version, params)
+    except OSError:
+        return compute()
+    result = cache.get(key)
+    if result is not None:
+        return result
+    result = compute()
+    if isinstance(result, dict) and "error" not in result:
+        try:
+            cache.put(key, result)
+        except OSError as e:
+            print(f"[WARNING] Failed to cache {extractor} result: {e}")
+    return result
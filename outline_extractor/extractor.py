@@ -1,17 +1,79 @@
 # main.py
 import os
-import fitz  # PyMuPDF
 import json
 try:
     from .utils import extract_headings
+    from .cache_utils import cached_extraction
+    from .layout_utils import parse_page_range
 except ImportError:
     from utils import extract_headings
+    from cache_utils import cached_extraction
+    from layout_utils import parse_page_range
 import sys
+import signal
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 INPUT_DIR = "input"
 OUTPUT_DIR = "output"
+EXTRACTOR_VERSION = "1"   # bump when extract_headings output changes
 
-def process_pdfs():
+def _timeout_handler(signum, frame):
+    raise TimeoutError("processing timed out")
+
+def _extract_file(pdf_path, timeout=None):
+    """Extract the outline of one PDF file (runs inside a worker)."""
+    alarm = timeout and hasattr(signal, "SIGALRM")
+    if alarm:
+        signal.signal(signal.SIGALRM, _timeout_handler)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        # input files stay in place, so their tables are stored for re-runs
+        return extract_headings(pdf_path, persist=True)
+    finally:
+        if alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+def _write_result(filename, title, outline):
+    output_json = {
+        "title": title,
+        "outline": outline
+    }
+    output_filename = filename.replace(".pdf", ".json")
+    with open(os.path.join(OUTPUT_DIR, output_filename), "w") as f:
+        json.dump(output_json, f, indent=2)
+    print(f"[SUCCESS] Processed {filename} -> {output_filename}")
+    print(f"  Title: {title}")
+    print("  Outline:")
+    for item in outline:
+        print(f"    - {item['level']}: {item['text']} (Page {item['page']})")
+
+def _process_parallel(pdfs, workers, timeout, ordered):
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(_extract_file, os.path.join(INPUT_DIR, filename), timeout): filename
+            for filename in pdfs
+        }
+        for future in (futures if ordered else as_completed(futures)):
+            filename = futures[future]
+            try:
+                title, outline = future.result()
+            except Exception as e:
+                print(f"[ERROR] Failed to process {filename}: {e}")
+                continue
+            try:
+                _write_result(filename, title, outline)
+            except Exception as e:
+                print(f"[ERROR] Failed to write output for {filename}: {e}")
+
+def process_pdfs(workers=1, timeout=None, ordered=True):
+    """
+    Extract outlines for every PDF in INPUT_DIR.
+
+    workers: number of worker processes; 1 runs in-process, 0 or None uses every core.
+    timeout: seconds allowed per file before it is reported as failed (POSIX only).
+    ordered: write results in directory order instead of as they complete.
+    """
     if not os.path.exists(INPUT_DIR):
         print(f"[ERROR] Input folder '{INPUT_DIR}' does not exist.")
         sys.exit(1)
@@ -22,38 +84,48 @@ def process_pdfs():
     if not pdfs:
         print(f"[WARNING] No PDF files found in '{INPUT_DIR}'.")
         return
+    if not workers:
+        workers = os.cpu_count() or 1
+    if timeout and not hasattr(signal, "SIGALRM"):
+        print("[WARNING] Per-file timeouts are not supported on this platform. Ignoring --timeout.")
+        timeout = None
+    if workers > 1 and len(pdfs) > 1:
+        _process_parallel(pdfs, min(workers, len(pdfs)), timeout, ordered)
+        return
     for filename in pdfs:
         pdf_path = os.path.join(INPUT_DIR, filename)
         try:
-            doc = fitz.open(pdf_path)
+            title, outline = _extract_file(pdf_path, timeout)
         except Exception as e:
-            print(f"[ERROR] Failed to open {filename}: {e}")
+            print(f"[ERROR] Failed to process {filename}: {e}")
             continue
         try:
-            title, outline = extract_headings(doc)
-            output_json = {
-                "title": title,
-                "outline": outline
-            }
-            output_filename = filename.replace(".pdf", ".json")
-            with open(os.path.join(OUTPUT_DIR, output_filename), "w") as f:
-                json.dump(output_json, f, indent=2)
-            print(f"[SUCCESS] Processed {filename} -> {output_filename}")
-            print(f"  Title: {title}")
-            print("  Outline:")
-            for item in outline:
-                print(f"    - {item['level']}: {item['text']} (Page {item['page']})")
+            _write_result(filename, title, outline)
         except Exception as e:
-            print(f"[ERROR] Failed to process {filename}: {e}")
+            print(f"[ERROR] Failed to write output for {filename}: {e}")
 
-def extract_outline_from_file(pdf_path):
-    import fitz
+def extract_outline_from_file(pdf_path, use_cache=True, pages=None, max_headings=None, persist=False):
+    """
+    Extract the outline of a PDF given as a path or as raw bytes.
+    ``pages`` (e.g. "1-20") limits it to a page range and ``max_headings``
+    stops once that many headings were found.  ``persist`` stores the parsed
+    table of a path that stays on disk, for incremental re-extraction.
+    """
     try:
-        doc = fitz.open(pdf_path)
-        title, outline = extract_headings(doc)
-        return {"title": title, "outline": outline}
-    except Exception as e:
+        pages = parse_page_range(pages)
+    except ValueError as e:
         return {"error": str(e)}
+    def compute():
+        try:
+            # given the path or bytes, large documents are parsed in parallel
+            title, outline = extract_headings(pdf_path, pages, max_headings, persist)
+            return {"title": title, "outline": outline}
+        except Exception as e:
+            return {"error": str(e)}
+    params = None
+    if pages is not None or max_headings is not None:
+        params = {"pages": pages, "max_headings": max_headings}
+    return cached_extraction(pdf_path, "outline", EXTRACTOR_VERSION, params, compute, use_cache)
 
 if __name__ == "__main__":
     try:
@@ -61,4 +133,12 @@ if __name__ == "__main__":
     except ImportError:
         print("[ERROR] PyMuPDF (fitz) is not installed. Please install it with 'pip install pymupdf'.")
         sys.exit(1)
-    process_pdfs()
+    parser = argparse.ArgumentParser(description="Extract PDF outlines from input/ into output/.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="worker processes (0 = one per CPU core, default 1)")
+    parser.add_argument("--timeout", type=float, default=None,
+                        help="seconds allowed per PDF before it is skipped")
+    parser.add_argument("--as-completed", action="store_true",
+                        help="write results as soon as each file finishes instead of in order")
+    args = parser.parse_args()
+    process_pdfs(workers=args.workers, timeout=args.timeout, ordered=not args.as_completed)
@@ -0,0 +1,468 @@
+# layout_utils.py
+"""
+Shared page-layout extraction for the outline, semantic and persona extractors.
+
+Every page is parsed once with ``page.get_text("dict")`` into a column-oriented
+line table.  Tables are cached per document, so running several extractors on
+the same PDF walks its pages a single time.
+
+Parsing can be limited to a page range and stopped early.  Pages are loaded
+one at a time and released after parsing, and MuPDF's resource store is
+trimmed periodically, so memory stays bounded on very large (e.g. scanned)
+files.
+
+Long documents are split into page ranges that worker processes parse
+independently (each opens the file itself); their tables are merged in
+page order before any font-level clustering runs.
+
+Tables of files that stay on disk can also be kept in a persistent store
+with a fingerprint per page, so after a revision only the changed pages are
+parsed again (see ``table_store``).
+"""
+import hashlib
+import multiprocessing
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    from .table_store import get_table_store
+except ImportError:
+    from table_store import get_table_store
+
+TABLE_CACHE_SIZE = 8        # documents kept in memory
+# trim MuPDF's font/image store after this many pages (0 = never)
+STORE_TRIM_PAGES = int(os.environ.get("PDF_STORE_TRIM_PAGES", "32"))
+# documents with at least this many pages are parsed in parallel (0 = never)
+PARALLEL_MIN_PAGES = int(os.environ.get("PDF_PARALLEL_MIN_PAGES", "200"))
+PAGE_WORKERS = int(os.environ.get("PDF_PAGE_WORKERS", os.cpu_count() or 1))
+SHARDS_PER_WORKER = 4       # smaller shards even out slow (e.g. scanned) page runs
+MIN_SHARD_PAGES = 25
+
+_FONT_SELECT_RE = re.compile(rb"/([^\s/\[\]<>(){}%]+)\s+[-+.\d]+\s+Tf")
+
+_table_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_progress = threading.local()
+
+
+class LineTable:
+    """
+    Line-level features of one document, stored column by column.
+
+    Line texts are concatenated into a single string buffer and addressed
+    through ``text_offsets``; the numeric columns are NumPy arrays so callers
+    can filter and classify lines with vectorized comparisons.
+    """
+
+    __slots__ = ("text_buffer", "text_offsets", "sizes", "first_sizes", "bboxes", "pages", "flags",
+                 "page_offsets", "first_page")
+
+    def __init__(self, texts, sizes, first_sizes, bboxes, pages, flags, page_offsets, first_page=1):
+        self.text_buffer = "".join(texts)
+        offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        np.cumsum([len(t) for t in texts], out=offsets[1:])
+        self.text_offsets = offsets                                  # (n + 1,)
+        self.sizes = np.asarray(sizes, dtype=np.float64)             # max span font size
+        self.first_sizes = np.asarray(first_sizes, dtype=np.float64)  # first span font size
+        self.bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)  # x0, y0, x1, y1
+        self.pages = np.asarray(pages, dtype=np.int32)               # 1-based page number
+        self.flags = np.asarray(flags, dtype=np.int32)               # OR of span flags
+        self.page_offsets = np.asarray(page_offsets, dtype=np.int64)  # page start lines, plus end
+        self.first_page = first_page                                 # 1-based number of the first page
+
+    def __len__(self):
+        return len(self.text_offsets) - 1
+
+    @property
+    def page_count(self):
+        return len(self.page_offsets) - 1
+
+    def text(self, i):
+        return self.text_buffer[self.text_offsets[i]:self.text_offsets[i + 1]]
+
+    def texts(self, start=0, end=None):
+        """Return the texts of lines ``start`` to ``end`` as a list."""
+        end = len(self) if end is None else end
+        offsets = self.text_offsets[start:end + 1].tolist()
+        buf = self.text_buffer
+        return [buf[a:b] for a, b in zip(offsets, offsets[1:])]
+
+    def columns(self):
+        """The table's columns by name (the ``table_store`` format)."""
+        return {name: getattr(self, name) for name in self.__slots__ if name != "first_page"}
+
+    @classmethod
+    def from_columns(cls, columns, first_page=1):
+        table = cls.__new__(cls)
+        for name, value in columns.items():
+            setattr(table, name, value)
+        table.first_page = first_page
+        return table
+
+    def slice_pages(self, first, last, new_first=None):
+        """The lines of pages ``first``..``last`` as a table, renumbered to start at ``new_first``."""
+        new_first = first if new_first is None else new_first
+        start, end = self.page_offsets[first - self.first_page], self.page_offsets[last - self.first_page + 1]
+        page_offsets = self.page_offsets[first - self.first_page:last - self.first_page + 2] - start
+        return LineTable(
+            [self.text(i) for i in range(start, end)], self.sizes[start:end], self.first_sizes[start:end],
+            self.bboxes[start:end],
+            self.pages[start:end] + (new_first - first), self.flags[start:end], page_offsets, new_first,
+        )
+
+    @classmethod
+    def concat(cls, tables):
+        """Join the tables of consecutive page ranges into one."""
+        tables = list(tables)
+        texts = [text for table in tables for text in table.texts()]
+        page_offsets = [0]
+        for table in tables:
+            page_offsets.extend((table.page_offsets[1:] + page_offsets[-1]).tolist())
+        return cls(
+            texts,
+            np.concatenate([t.sizes for t in tables]),
+            np.concatenate([t.first_sizes for t in tables]),
+            np.concatenate([t.bboxes for t in tables]),
+            np.concatenate([t.pages for t in tables]),
+            np.concatenate([t.flags for t in tables]),
+            page_offsets,
+            tables[0].first_page if tables else 1,
+        )
+
+    def page_range(self, page_num):
+        """Return the ``(start, end)`` line indices of a 1-based page."""
+        i = page_num - self.first_page
+        return int(self.page_offsets[i]), int(self.page_offsets[i + 1])
+
+
+class PageRangeError(ValueError):
+    """A page range that lies outside the document"""
+
+
+def parse_page_range(value):
+    """
+    Normalize a page range to 1-based inclusive ``(first, last)``, where
+    ``last`` is None for "to the end".  Accepts None (all pages), a page
+    number, a ``(first, last)`` pair or a string such as "5", "3-10" or "3-".
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, int):
+        first, last = value, value
+    elif isinstance(value, str):
+        start, sep, end = value.strip().partition("-")
+        first = int(start) if start.strip() else 1
+        last = (int(end) if end.strip() else None) if sep else first
+    else:
+        first, last = value
+        first = int(first) if first is not None else 1
+        last = int(last) if last is not None else None
+    if first < 1 or (last is not None and last < first):
+        raise ValueError(f"Invalid page range: {value!r}")
+    return first, last
+
+
+def _page_lines(page_dict):
+    """Yield ``(text, max size, first span size, bbox, flags)`` for each non-empty line of a page."""
+    for block in page_dict["blocks"]:
+        for line in block.get("lines", []):
+            spans = line["spans"]
+            text = " ".join(
+                span["text"] for span in spans if span["text"].strip()
+            ).strip()
+            if not text:
+                continue
+            flags = 0
+            for span in spans:
+                flags |= span.get("flags", 0)
+            yield text, max(span["size"] for span in spans), spans[0]["size"], line["bbox"], flags
+
+
+@contextmanager
+def report_progress(callback):
+    """
+    Call ``callback(pages_done, page_count)`` after every page parsed by this
+    thread while the block runs, whichever extractor triggers the parse.
+    """
+    previous = getattr(_progress, "callback", None)
+    _progress.callback = callback
+    try:
+        yield
+    finally:
+        _progress.callback = previous
+
+
+def extract_line_table(doc, pages=None, stop=None):
+    """
+    Parse the pages of an open ``fitz`` document into a LineTable.
+
+    ``pages`` limits parsing to a range (see ``parse_page_range``).  If
+    ``stop`` is given it is called with the LineTable of the pages parsed so
+    far after 1, 2, 4, 8, ... pages, and parsing ends once it returns True.
+    """
+    import fitz  # PyMuPDF
+    page_range = parse_page_range(pages)
+    first, last = page_range or (1, None)
+    if page_range is not None and first > len(doc):
+        raise PageRangeError(f"Page {first} is past the end of the document ({len(doc)} pages)")
+    last = len(doc) if last is None else min(last, len(doc))
+    texts, sizes, first_sizes, bboxes, page_nums, flags = [], [], [], [], [], []
+    page_offsets = [0]
+    progress = getattr(_progress, "callback", None)
+    page_total = max(0, last - first + 1)
+    next_check = 1
+    for done, page_num in enumerate(range(first, last + 1), start=1):
+        page = doc.load_page(page_num - 1)
+        page_dict = page.get_text("dict")
+        del page                                      # release the page before the next one
+        for text, size, first_size, bbox, line_flags in _page_lines(page_dict):
+            texts.append(text)
+            sizes.append(size)
+            first_sizes.append(first_size)
+            bboxes.append(bbox)
+            page_nums.append(page_num)
+            flags.append(line_flags)
+        page_offsets.append(len(texts))
+        if STORE_TRIM_PAGES and done % STORE_TRIM_PAGES == 0:
+            fitz.TOOLS.store_shrink(100)
+        if progress is not None:
+            progress(done, page_total)
+        if stop is not None and done == next_check and done < page_total:
+            next_check *= 2
+            if stop(LineTable(texts, sizes, first_sizes, bboxes, page_nums, flags, page_offsets, first)):
+                break
+    return LineTable(texts, sizes, first_sizes, bboxes, page_nums, flags, page_offsets, first)
+
+
+def open_pdf(source):
+    """Open a PDF given as a file path or as raw bytes (e.g. an in-memory upload)."""
+    # PyMuPDF is imported on first use: cached results never need it
+    import fitz  # PyMuPDF
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return fitz.open(stream=source, filetype="pdf")
+    return fitz.open(source)
+
+
+def _is_document(source):
+    return not isinstance(source, (str, os.PathLike, bytes, bytearray, memoryview))
+
+
+def _cache_key(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return None
+    path = source if isinstance(source, (str, os.PathLike)) else getattr(source, "name", "")
+    if not path or not os.path.isfile(path):
+        return None
+    stat = os.stat(path)
+    return os.path.abspath(path), stat.st_mtime_ns, stat.st_size
+
+
+def page_fingerprints(doc):
+    """
+    A fingerprint of every page's content: its content stream, the form
+    XObjects it draws, the fonts it selects and its geometry.  Much cheaper
+    than parsing.
+    """
+    fingerprints = []
+    for page_num in range(len(doc)):
+        page = doc.load_page(page_num)
+        contents = page.read_contents()
+        digest = hashlib.sha1(contents)
+        for xref, *_ in page.get_xobjects():
+            digest.update(doc.xref_stream(xref) or b"")
+        # Pages often share one resource dictionary, so fonts added for
+        # another page must not count; font xrefs change when a file is
+        # rewritten, so only names do.
+        used = {name.decode("latin-1") for name in _FONT_SELECT_RE.findall(contents)}
+        fonts = [font[2:6] for font in page.get_fonts() if font[4] in used]
+        digest.update(repr((fonts, tuple(page.rect), page.rotation)).encode("utf-8"))
+        fingerprints.append(digest.hexdigest())
+    return fingerprints
+
+
+def _page_runs(fingerprints, stored_fingerprints):
+    """
+    Split the pages into runs ``(first, last, stored_first)``: runs that can
+    be copied from the stored table (pages ``stored_first``...) and runs to
+    parse (``stored_first`` None).  Unchanged pages are found by fingerprint,
+    so inserted or removed pages do not invalidate the rest.
+    """
+    stored_pages = {}
+    for page_num, fingerprint in enumerate(stored_fingerprints, start=1):
+        stored_pages.setdefault(fingerprint, page_num)
+    runs = []
+    for page_num, fingerprint in enumerate(fingerprints, start=1):
+        source = stored_pages.get(fingerprint)
+        if runs:
+            first, last, stored_first = runs[-1]
+            follows = source is None if stored_first is None else source == stored_first + (page_num - first)
+            if follows:
+                runs[-1] = (first, page_num, stored_first)
+                continue
+        runs.append((page_num, page_num, source))
+    return runs
+
+
+def _incremental_line_table(doc, stored, fingerprints):
+    """
+    Rebuild the table of a revised document from the stored table of its
+    previous version, parsing only pages whose fingerprint changed.
+    Returns None if no page can be reused.
+    """
+    columns, stored_fingerprints = stored
+    runs = _page_runs(fingerprints, stored_fingerprints)
+    if all(stored_first is None for _, _, stored_first in runs):
+        return None
+    previous = LineTable.from_columns(columns)
+    progress = getattr(_progress, "callback", None)
+    pieces = []
+    with report_progress(None):
+        for first, last, stored_first in runs:
+            if stored_first is None:
+                pieces.append(extract_line_table(doc, (first, last)))
+            else:
+                pieces.append(previous.slice_pages(stored_first, stored_first + last - first, first))
+    if progress is not None:
+        progress(len(fingerprints), len(fingerprints))
+    return LineTable.concat(pieces)
+
+
+_page_pool = None
+_page_pool_lock = threading.Lock()
+
+
+def _get_page_pool():
+    global _page_pool
+    with _page_pool_lock:
+        if _page_pool is None:
+            # Forking is only safe while this is the sole thread (the CLIs);
+            # the API parses from request threads, so it spawns instead.
+            method = "fork" if threading.active_count() == 1 and "fork" in multiprocessing.get_all_start_methods() else "spawn"
+            _page_pool = ProcessPoolExecutor(max_workers=PAGE_WORKERS, mp_context=multiprocessing.get_context(method))
+        return _page_pool
+
+
+def _parse_shard(source, first, last):
+    """Worker: open the PDF and parse one page range"""
+    doc = open_pdf(source)
+    try:
+        return extract_line_table(doc, (first, last))
+    finally:
+        doc.close()
+
+
+def _shards(first, last, per_worker):
+    count = last - first + 1
+    size = max(MIN_SHARD_PAGES, -(-count // (PAGE_WORKERS * per_worker)))
+    return [(start, min(start + size - 1, last)) for start in range(first, last + 1, size)]
+
+
+def extract_line_table_parallel(source, first, last):
+    """
+    Parse pages ``first``..``last`` of a PDF path or bytes in worker
+    processes, one page range per task, and merge the results in order.
+    """
+    in_memory = isinstance(source, (bytes, bytearray, memoryview))
+    if isinstance(source, memoryview):
+        source = bytes(source)
+    # in-memory PDFs are copied to the worker with every task, so they get
+    # one shard per worker
+    shards = _shards(first, last, 1 if in_memory else SHARDS_PER_WORKER)
+    progress = getattr(_progress, "callback", None)
+    pool = _get_page_pool()
+    futures = {pool.submit(_parse_shard, source, a, b): i for i, (a, b) in enumerate(shards)}
+    tables = [None] * len(shards)
+    done = 0
+    for future in as_completed(futures):
+        table = future.result()
+        tables[futures[future]] = table
+        done += table.page_count
+        if progress is not None:
+            progress(done, last - first + 1)
+    return LineTable.concat(tables)
+
+
+def get_line_table(source, pages=None, stop=None, persist=False):
+    """
+    Return the LineTable for a PDF path, PDF bytes or an open ``fitz`` document,
+    optionally limited to ``pages`` and stopped early by ``stop`` (see
+    ``extract_line_table``).
+
+    Tables of on-disk files are cached by path, modification time, size and
+    page range, so the outline, semantic and persona extractors share one
+    parse.  Tables cut short by ``stop`` are not cached.  Paths and bytes of
+    at least PARALLEL_MIN_PAGES pages are parsed in worker processes, unless
+    this already is a worker process (e.g. of the section or watch-folder
+    pool), which parses serially rather than start a pool of its own.
+
+    With ``persist`` the whole-file table of a path is also kept in the
+    fingerprinted table store, so a later revision of the same file only
+    parses its changed pages.  Only set it for files that stay in place.
+    """
+    pages = parse_page_range(pages)
+    key = _cache_key(source) if stop is None else None
+    if key is not None and pages is not None:
+        key += pages
+    if key is not None:
+        with _cache_lock:
+            table = _table_cache.get(key)
+            if table is not None:
+                _table_cache.move_to_end(key)
+                return table
+
+    if _is_document(source):
+        table = extract_line_table(source, pages, stop)
+    else:
+        # whole files on disk go through the fingerprinted table store
+        store = get_table_store() if persist and key is not None and pages is None else None
+        doc = open_pdf(source)
+        try:
+            table, fingerprints = None, None
+            if store is not None and len(doc):
+                fingerprints = page_fingerprints(doc)
+                stored = store.load(key[0])
+                if stored is not None:
+                    table = _incremental_line_table(doc, stored, fingerprints)
+            first, last = pages or (1, None)
+            last = len(doc) if last is None else min(last, len(doc))
+            parallel = (table is None and stop is None and PARALLEL_MIN_PAGES and PAGE_WORKERS > 1
+                        and last - first + 1 >= PARALLEL_MIN_PAGES
+                        and multiprocessing.parent_process() is None)
+            if table is None and not parallel:
+                table = extract_line_table(doc, pages, stop)
+        finally:
+            doc.close()
+        if parallel:
+            try:
+                table = extract_line_table_parallel(source, first, last)
+            except Exception as e:
+                print(f"[WARNING] Parallel page parsing failed ({e}); parsing serially.")
+                doc = open_pdf(source)
+                try:
+                    table = extract_line_table(doc, pages)
+                finally:
+                    doc.close()
+
+        if fingerprints is not None and len(fingerprints) == table.page_count:
+            try:
+                store.save(key[0], table.columns(), fingerprints)
+            except OSError as e:
+                print(f"[WARNING] Failed to store line table: {e}")
+
+    if key is not None:
+        with _cache_lock:
+            _table_cache[key] = table
+            while len(_table_cache) > TABLE_CACHE_SIZE:
+                _table_cache.popitem(last=False)
+    return table
+
+
+def clear_line_table_cache():
+    with _cache_lock:
+        _table_cache.clear()
@@ -0,0 +1,87 @@
+# level_utils.py
+"""
+Heading-level detection on one-dimensional font sizes.
+
+Font sizes in a document take only a handful of distinct values, so instead
+of running a general-purpose clusterer over every line we collapse them into
+a weighted histogram of unique sizes and solve 1-D k-means exactly with
+dynamic programming (the same objective as Jenks natural breaks).  The
+result is deterministic and costs O(k * m^2) for m unique sizes.
+"""
+import numpy as np
+
+
+def size_histogram(sizes):
+    """Return the ascending unique sizes and how many lines use each one."""
+    return np.unique(np.asarray(sizes, dtype=np.float64), return_counts=True)
+
+
+def kmeans_1d(values, weights, k):
+    """
+    Optimal weighted 1-D k-means over sorted ``values``.
+
+    Returns ``(centers, bounds)``: the ascending cluster centers and the
+    index into ``values`` where each cluster starts (``bounds[0] == 0``).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    weights = np.asarray(weights, dtype=np.float64)
+    m = len(values)
+    k = max(1, min(k, m))
+
+    # Prefix sums give the weighted sum of squared errors of any run in O(1).
+    w = np.concatenate(([0.0], np.cumsum(weights)))
+    wx = np.concatenate(([0.0], np.cumsum(weights * values)))
+    wxx = np.concatenate(([0.0], np.cumsum(weights * values * values)))
+
+    def run_cost(starts, end):
+        # cost of values[starts:end] for an array of start indices
+        cw = w[end] - w[starts]
+        cx = wx[end] - wx[starts]
+        return (wxx[end] - wxx[starts]) - cx * cx / cw
+
+    # cost[c, j]: best cost of splitting values[:j] into c + 1 clusters
+    cost = np.full((k, m + 1), np.inf)
+    split = np.zeros((k, m + 1), dtype=np.int64)
+    ends = np.arange(1, m + 1)
+    cost[0, 1:] = run_cost(np.zeros(m, dtype=np.int64), ends)
+    for c in range(1, k):
+        for j in range(c + 1, m + 1):
+            starts = np.arange(c, j)
+            total = cost[c - 1, starts] + run_cost(starts, j)
+            best = int(np.argmin(total))
+            cost[c, j] = total[best]
+            split[c, j] = starts[best]
+
+    bounds = [0] * k
+    end = m
+    for c in range(k - 1, 0, -1):
+        bounds[c] = int(split[c, end])
+        end = bounds[c]
+    edges = bounds + [m]
+    centers = np.array([
+        (wx[edges[c + 1]] - wx[edges[c]]) / (w[edges[c + 1]] - w[edges[c]])
+        for c in range(k)
+    ])
+    return centers, np.array(bounds, dtype=np.int64)
+
+
+def level_centers(sizes, k):
+    """Return the ``k`` font-size cluster centers of ``sizes``, largest first."""
+    values, counts = size_histogram(sizes)
+    centers, _ = kmeans_1d(values, counts, k)
+    return centers[::-1]
+
+
+def cluster_labels(sizes, k):
+    """
+    Cluster ``sizes`` into at most ``k`` levels.
+
+    Returns ``(labels, centers)`` where ``labels[i]`` is the rank of the
+    cluster of ``sizes[i]`` (0 = largest font) and ``centers`` are descending.
+    """
+    sizes = np.asarray(sizes, dtype=np.float64)
+    values, counts = size_histogram(sizes)
+    centers, bounds = kmeans_1d(values, counts, k)
+    first_values = values[bounds]
+    ascending = np.searchsorted(first_values, sizes, side="right") - 1
+    return len(centers) - 1 - ascending, centers[::-1]
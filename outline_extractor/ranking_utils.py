@@ -0,0 +1,117 @@
+# ranking_utils.py
+"""
+Ranking helpers shared by the persona extractor and the spaCy search.
+
+Rankers keep their scores in a NumPy vector and select the best ``top_k``
+with ``argpartition`` (O(n)) instead of sorting ``(score, section)`` tuples.
+Ties keep their original order, exactly as a stable descending sort would.
+
+``BM25Index`` is the lexical ranker used when no embedding model is
+available: every text is tokenized once into an inverted index, and a
+query only touches the postings of its own terms.
+"""
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+TOKEN_RE = re.compile(r"\w+")
+BM25_CACHE_SIZE = 8
+
+
+def top_k_indices(scores, top_k=None):
+    """Indices of the ``top_k`` highest scores, best first (all when top_k is None)."""
+    scores = np.asarray(scores)
+    n = len(scores)
+    if top_k is None or top_k >= n:
+        return np.argsort(-scores, kind="stable")
+    if top_k <= 0:
+        return np.empty(0, dtype=np.int64)
+    threshold = scores[np.argpartition(-scores, top_k - 1)[top_k - 1]]
+    above = np.flatnonzero(scores > threshold)
+    ties = np.flatnonzero(scores == threshold)[:top_k - len(above)]
+    candidates = np.concatenate([above, ties])
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def select_top_k(items, scores, top_k=None):
+    """The ``top_k`` items with the highest scores, best first."""
+    return [items[i] for i in top_k_indices(scores, top_k)]
+
+
+def tokenize(text):
+    """Lower-cased word tokens of ``text``."""
+    return TOKEN_RE.findall(text.lower())
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed list of texts, stored as an inverted index."""
+
+    def __init__(self, texts, k1=1.5, b=0.75):
+        self.vocab = {}
+        self.size = len(texts)
+        term_of = self.vocab.setdefault
+        token_ids = []
+        doc_lengths = np.zeros(self.size, dtype=np.float64)
+        for doc_id, text in enumerate(texts):
+            ids = [term_of(term, len(self.vocab)) for term in tokenize(text)]
+            doc_lengths[doc_id] = len(ids)
+            token_ids.extend(ids)
+        token_ids = np.asarray(token_ids, dtype=np.int64)
+        token_docs = np.repeat(np.arange(self.size, dtype=np.int64), doc_lengths.astype(np.int64))
+
+        # postings grouped by term: _docs[_offsets[t]:_offsets[t + 1]]
+        postings, tf = np.unique(token_ids * max(self.size, 1) + token_docs, return_counts=True)
+        term_ids = postings // max(self.size, 1)
+        df = np.bincount(term_ids, minlength=len(self.vocab))
+        self._offsets = np.concatenate([[0], np.cumsum(df)])
+        self._docs = postings % max(self.size, 1)
+
+        # the document part of BM25 does not depend on the query, so each
+        # posting stores its final weight
+        tf = tf.astype(np.float64)
+        avg_length = doc_lengths.mean() if self.size and doc_lengths.any() else 1.0
+        norm = k1 * (1 - b + b * doc_lengths[self._docs] / avg_length)
+        idf = np.log1p((self.size - df + 0.5) / (df + 0.5))
+        self._weights = np.repeat(idf, df) * tf * (k1 + 1) / (tf + norm)
+
+    def scores(self, query):
+        """BM25 score of every text for ``query``, as a vector."""
+        scores = np.zeros(self.size, dtype=np.float64)
+        for term in set(tokenize(query)):
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            start, end = self._offsets[term_id], self._offsets[term_id + 1]
+            scores[self._docs[start:end]] += self._weights[start:end]
+        return scores
+
+    def top_k(self, query, top_k=None):
+        """Indices of the best ``top_k`` texts for ``query``, best first."""
+        return top_k_indices(self.scores(query), top_k)
+
+
+_bm25_cache = OrderedDict()
+_bm25_cache_lock = threading.Lock()
+
+
+def get_bm25_index(texts):
+    """Return a BM25Index over ``texts``, reusing one built for the same texts."""
+    digest = hashlib.sha1()
+    for text in texts:
+        digest.update(text.encode("utf-8", "surrogatepass"))
+        digest.update(b"\0")
+    key = digest.hexdigest()
+    with _bm25_cache_lock:
+        index = _bm25_cache.get(key)
+        if index is not None:
+            _bm25_cache.move_to_end(key)
+            return index
+    index = BM25Index(texts)
+    with _bm25_cache_lock:
+        _bm25_cache[key] = index
+        while len(_bm25_cache) > BM25_CACHE_SIZE:
+            _bm25_cache.popitem(last=False)
+    return index
@@ -0,0 +1,127 @@
+# table_store.py
+"""
+On-disk store of parsed line tables with per-page fingerprints.
+
+A table is saved per PDF file (keyed by its absolute path) together with a
+fingerprint of every page's content.  When the file is revised and parsed
+again, pages whose fingerprint is unchanged are copied from the stored
+table and only new or changed pages are parsed.  Only callers reading
+files that stay in place (the command-line extractors and the watch folder)
+store tables; uploads and other temporary files are never saved.  The
+directory is bounded in size and evicts the least recently used tables
+first.
+"""
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+STORE_DIR = os.environ.get(
+    "PDF_LINE_TABLE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "pdf_intelligence", "line_tables"),
+)
+STORE_MAX_MB = float(os.environ.get("PDF_LINE_TABLE_MAX_MB", "512"))
+STORE_ENABLED = os.environ.get("PDF_LINE_TABLE_STORE", "1") != "0"
+
+# LineTable columns saved as arrays, besides the text buffer and fingerprints
+COLUMNS = ("text_offsets", "sizes", "first_sizes", "bboxes", "pages", "flags", "page_offsets")
+
+
+class TableStore:
+    """Size-bounded LRU store of line table columns, one ``.npz`` per document."""
+
+    def __init__(self, directory=STORE_DIR, max_bytes=int(STORE_MAX_MB * 1024 * 1024)):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._bytes = None          # lazily measured on first write
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, doc_key):
+        return os.path.join(self.directory, hashlib.sha256(doc_key.encode("utf-8")).hexdigest()[:32] + ".npz")
+
+    def load(self, doc_key):
+        """Return ``(columns, fingerprints)`` stored for ``doc_key``, or None."""
+        path = self._path(doc_key)
+        try:
+            with np.load(path) as data:
+                if str(data["doc_key"]) != doc_key:
+                    return None
+                columns = {name: data[name] for name in COLUMNS}
+                columns["text_buffer"] = data["text_buffer"].tobytes().decode("utf-8", "surrogatepass")
+                fingerprints = [str(fp) for fp in data["fingerprints"]]
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            return None
+        return columns, fingerprints
+
+    def save(self, doc_key, columns, fingerprints):
+        path = self._path(doc_key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f, doc_key=np.array(doc_key),
+                text_buffer=np.frombuffer(columns["text_buffer"].encode("utf-8", "surrogatepass"), dtype=np.uint8),
+                fingerprints=np.array(fingerprints, dtype=str),
+                **{name: columns[name] for name in COLUMNS},
+            )
+        size = os.path.getsize(tmp_path)
+        with self._lock:
+            try:
+                replaced = os.path.getsize(path)
+            except OSError:
+                replaced = 0
+            os.replace(tmp_path, path)
+            if self._bytes is None:
+                self._bytes = self._scan()[1]
+            else:
+                self._bytes += size - replaced
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def _scan(self):
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".npz"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+        return entries, total
+
+    def _evict(self):
+        entries, total = self._scan()
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._bytes = total
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_table_store():
+    """Return the process-wide table store, or None if disabled or unusable."""
+    global _store
+    if not STORE_ENABLED:
+        return None
+    with _store_lock:
+        if _store is None:
+            try:
+                _store = TableStore()
+            except OSError as e:
+                print(f"[WARNING] Line table store disabled: {e}")
+                return None
+        return _store
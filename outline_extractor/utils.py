@@ -1,83 +1,75 @@
-# utils.py  – revised
-import numpy as np
-from collections import defaultdict
-from sklearn.cluster import KMeans
-import warnings
-from sklearn.exceptions import ConvergenceWarning
-
+# utils.py  – revised
 try:
     import numpy as np
 except ImportError:
     print("[ERROR] numpy is not installed. Please install it with 'pip install numpy'.")
     np = None
 try:
-    from sklearn.cluster import KMeans
-    from sklearn.exceptions import ConvergenceWarning
+    from .layout_utils import get_line_table
+    from .level_utils import level_centers
 except ImportError:
-    print("[ERROR] scikit-learn is not installed. Please install it with 'pip install scikit-learn'.")
-    KMeans = None
-    ConvergenceWarning = None
-
-def extract_headings(doc):
-    if np is None or KMeans is None:
-        return "Unknown Title", []
-    line_rows = []          # (text, max_font_size, page_num)
-    font_sizes = []         # list[float]
-
-    # ---------- 1. Gather line‑level text + max font size ----------
-    for page_idx, page in enumerate(doc, start=1):
-        for block in page.get_text("dict")["blocks"]:
-            for line in block.get("lines", []):
-                text = " ".join(
-                    span["text"] for span in line["spans"] if span["text"].strip()
-                ).strip()
-                if not text:
-                    continue
-                size = max(span["size"] for span in line["spans"])
-                line_rows.append((text, size, page_idx))
-                font_sizes.append(size)
-
-    if not line_rows:                                 # empty doc guard
-        return "Unknown Title", []
+    from layout_utils import get_line_table
+    from level_utils import level_centers
 
+def classify_levels(sizes):
+    """
+    Heading level of every line from its font size: 0-2 for H1-H3, and
+    ``is_heading`` marks the lines that are headings at all.
+    """
     # ---------- 2. Work out thresholds for H1/H2/H3 ----------
-    uniq_sizes = sorted(set(font_sizes), reverse=True)
-    headings = []
+    uniq_sizes = np.unique(sizes)[::-1]
 
     if len(uniq_sizes) <= 3:
         # Few distinct sizes → assume top 3 are H1/H2/H3
-        thresholds = uniq_sizes
-        def classify(sz):
-            for i, thr in enumerate(thresholds):
-                if sz >= thr - 0.1:                   # small tolerance
-                    return f"H{i+1}"
-            return None
+        thresholds = uniq_sizes - 0.1                 # small tolerance
     else:
-        # Use KMeans, but adapt cluster count to avoid the warning
-        with warnings.catch_warnings():
-            warnings.filterwarnings("ignore", category=ConvergenceWarning)
-            n_clusters = min(4, len(uniq_sizes))
-            km = KMeans(n_clusters=n_clusters, random_state=42, n_init="auto").fit(
-                np.array(font_sizes).reshape(-1, 1)
-            )
-        centers = sorted(km.cluster_centers_.flatten(), reverse=True)
+        # Exact 1-D k-means over the histogram of unique sizes
+        n_clusters = min(4, len(uniq_sizes))
+        centers = level_centers(sizes, n_clusters)
+        thresholds = centers - 0.5
+
+    # ---------- 3. Classify every line at once ----------
+    # thresholds are descending, so a line's level is the number of
+    # thresholds it falls below; anything past H3 (or past the last
+    # threshold) is body text.
+    levels = len(thresholds) - np.searchsorted(thresholds[::-1], sizes, side="right")
+    is_heading = levels < min(3, len(thresholds))
+    return levels, is_heading
 
-        def classify(sz):
-            for i, c in enumerate(centers):
-                if sz >= c - 0.5:
-                    return f"H{i+1}" if i < 3 else None
-            return None
+def extract_headings(doc, pages=None, max_headings=None, persist=False):
+    """
+    Return ``(title, headings)`` for a PDF path, bytes or open document.
+    ``pages`` limits the outline to a page range; with ``max_headings`` the
+    document is only parsed until the pages read so far hold that many
+    headings, and the outline is cut to that length.  ``persist`` keeps
+    the parsed table of a path in the table store (see ``get_line_table``).
+    """
+    if np is None:
+        return "Unknown Title", []
+    # ---------- 1. Gather line‑level text + max font size ----------
+    def enough_headings(partial):
+        return len(partial) > 0 and classify_levels(partial.sizes)[1].sum() >= max_headings
 
-    # ---------- 3. Build outline ----------
-    for text, size, page in line_rows:
-        level = classify(size)
-        if level:
-            headings.append({"level": level, "text": text, "page": page})
+    table = get_line_table(doc, pages, enough_headings if max_headings is not None else None, persist)
+    sizes = table.sizes                               # float64 column, one per line
 
-    # ---------- 4. Title = largest heading on first page ----------
-    first_page_headings = [
-        h for h in headings if h["page"] == 1 and h["level"] == "H1"
+    if not len(table):                                # empty doc guard
+        return "Unknown Title", []
+
+    levels, is_heading = classify_levels(sizes)
+    heading_idx = np.flatnonzero(is_heading)[:max_headings]
+
+    headings = [
+        {"level": f"H{level + 1}", "text": table.text(i), "page": page}
+        for i, level, page in zip(
+            heading_idx.tolist(),
+            levels[heading_idx].tolist(),
+            table.pages[heading_idx].tolist(),
+        )
     ]
-    title = first_page_headings[0]["text"] if first_page_headings else "Unknown Title"
+
+    # ---------- 4. Title = largest heading on first page ----------
+    first_h1 = np.flatnonzero(is_heading & (levels == 0) & (table.pages == 1))
+    title = table.text(first_h1[0]) if len(first_h1) else "Unknown Title"
 
     return title, headings
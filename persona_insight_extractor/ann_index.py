@@ -0,0 +1,241 @@
+"""
+Inverted-file (IVF) approximate nearest-neighbour index in pure NumPy.
+
+Vectors are grouped by their nearest k-means centroid ("list"); a query only
+scores the vectors of its ``nprobe`` closest lists, so top-k search touches a
+small fraction of the corpus.  Vectors are added and removed per key (one
+key per document).  New vectors are assigned to the existing centroids and
+scanned from a pending area until the lists are rebuilt, and the centroids
+are retrained whenever the index has grown well past the size they were
+trained on.  Small indexes (below ``min_train_size``) are searched exactly.
+
+Vectors are expected to be L2-normalised, so scores are cosine similarities.
+"""
+
+import os
+import threading
+
+import numpy as np
+
+from semantic_utils import top_k_indices
+
+NPROBE = int(os.environ.get("PERSONA_ANN_NPROBE", "8"))
+MIN_TRAIN_SIZE = 4096        # below this many vectors search is exact
+RETRAIN_GROWTH = 4           # retrain once the index is this many times larger
+KMEANS_ITERATIONS = 10
+TRAIN_SAMPLES_PER_LIST = 64
+ASSIGN_CHUNK = 65536
+
+
+def _assign(vectors, centroids):
+    """Index of the nearest centroid for every vector, in chunks"""
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), ASSIGN_CHUNK):
+        labels[start:start + ASSIGN_CHUNK] = np.argmax(vectors[start:start + ASSIGN_CHUNK] @ centroids.T, axis=1)
+    return labels
+
+
+def spherical_kmeans(vectors, k, iterations=KMEANS_ITERATIONS, seed=0):
+    """Cluster unit vectors by cosine similarity; return unit centroids (k x dim)"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        labels = _assign(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        norms = np.linalg.norm(sums, axis=1)
+        empty = norms == 0
+        # reseed empty lists with random vectors so every list stays usable
+        sums[empty] = vectors[rng.choice(len(vectors), size=int(empty.sum()))]
+        norms[empty] = np.linalg.norm(sums[empty], axis=1)
+        centroids = sums / np.maximum(norms, 1e-12)[:, None]
+    return centroids.astype(np.float32)
+
+
+class IVFIndex:
+    """Approximate top-k cosine search over per-key groups of vectors."""
+
+    def __init__(self, dim, nprobe=NPROBE, min_train_size=MIN_TRAIN_SIZE):
+        self.dim = dim
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self._vectors = np.empty((0, dim), dtype=np.float32)
+        self._owner = np.empty(0, dtype=np.int64)     # row -> key id
+        self._local = np.empty(0, dtype=np.int32)     # row -> row within its key
+        self._alive = np.empty(0, dtype=bool)
+        self._assign = np.empty(0, dtype=np.int32)    # row -> list (when trained)
+        self._size = 0
+        self._keys = []                               # key id -> key
+        self._rows = {}                               # key -> (key id, first row, row count)
+        self._dead = 0
+        self._centroids = None
+        self._trained_size = 0
+        self._order = None                            # rows sorted by list
+        self._offsets = None                          # list boundaries in _order
+        self._indexed = 0                             # rows covered by _order
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return self._size - self._dead
+
+    def __contains__(self, key):
+        return key in self._rows
+
+    def keys(self):
+        return list(self._rows)
+
+    # ---------- updates ----------
+    def _reserve(self, n):
+        capacity = len(self._vectors)
+        if self._size + n <= capacity:
+            return
+        capacity = max(self._size + n, 2 * capacity, 1024)
+        for name in ("_vectors", "_owner", "_local", "_alive", "_assign"):
+            old = getattr(self, name)
+            new = np.empty((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+
+    def add(self, key, vectors):
+        """Add (or replace) the vectors stored under ``key``"""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        with self._lock:
+            if key in self._rows:
+                self.remove(key)
+            n = len(vectors)
+            self._reserve(n)
+            start, end = self._size, self._size + n
+            key_id = len(self._keys)
+            self._keys.append(key)
+            self._vectors[start:end] = vectors
+            self._owner[start:end] = key_id
+            self._local[start:end] = np.arange(n, dtype=np.int32)
+            self._alive[start:end] = True
+            if self._centroids is not None:
+                self._assign[start:end] = _assign(vectors, self._centroids)
+            self._size = end
+            self._rows[key] = (key_id, start, n)
+            if len(self) >= self.min_train_size and len(self) >= RETRAIN_GROWTH * self._trained_size:
+                self.train()
+
+    def remove(self, key):
+        """Drop the vectors stored under ``key`` (no-op if absent)"""
+        with self._lock:
+            entry = self._rows.pop(key, None)
+            if entry is None:
+                return
+            _, start, n = entry
+            self._alive[start:start + n] = False
+            self._dead += n
+            if self._dead > len(self):
+                self._compact()
+
+    def _compact(self):
+        """Rewrite storage without removed rows"""
+        keep = np.flatnonzero(self._alive[:self._size])
+        key_ids = sorted(key_id for key_id, _, _ in self._rows.values())
+        remap = np.full(len(self._keys), -1, dtype=np.int64)
+        remap[key_ids] = np.arange(len(key_ids))
+        self._keys = [self._keys[i] for i in key_ids]
+        self._vectors = self._vectors[keep]
+        self._owner = remap[self._owner[keep]]
+        self._local = self._local[keep]
+        self._alive = self._alive[keep]
+        self._assign = self._assign[keep]
+        self._size = len(keep)
+        self._dead = 0
+        self._index_keys()
+        self._order = None
+        self._indexed = 0
+
+    def _index_keys(self):
+        # rows of a key are contiguous and keys are stored in row order
+        counts = np.bincount(self._owner[:self._size], minlength=len(self._keys))
+        starts = np.cumsum(counts) - counts
+        self._rows = {key: (i, int(starts[i]), int(counts[i])) for i, key in enumerate(self._keys)}
+
+    def train(self):
+        """(Re)build the centroids and lists from the current vectors"""
+        with self._lock:
+            if self._dead:
+                self._compact()
+            n = self._size
+            if n < self.min_train_size:
+                return
+            nlist = max(1, int(np.sqrt(n)))
+            vectors = self._vectors[:n]
+            sample_size = min(n, nlist * TRAIN_SAMPLES_PER_LIST)
+            sample = vectors[np.random.default_rng(0).choice(n, size=sample_size, replace=False)]
+            self._centroids = spherical_kmeans(sample, nlist)
+            self._assign[:n] = _assign(vectors, self._centroids)
+            self._trained_size = n
+            self._order = None
+            self._indexed = 0
+
+    def _build_lists(self):
+        nlist = len(self._centroids)
+        self._order = np.argsort(self._assign[:self._size], kind="stable").astype(np.int64)
+        self._offsets = np.searchsorted(self._assign[self._order], np.arange(nlist + 1))
+        self._indexed = self._size
+
+    # ---------- queries ----------
+    def search(self, query, top_k=10):
+        """Return up to ``top_k`` ``(key, row within key, score)`` tuples, best first"""
+        query = np.asarray(query, dtype=np.float32).reshape(self.dim)
+        with self._lock:
+            if self._centroids is None:
+                rows = np.flatnonzero(self._alive[:self._size])
+            else:
+                # fold pending rows into the lists once they are a noticeable share
+                if self._order is None or self._size - self._indexed > self._size // 10:
+                    self._build_lists()
+                probe = top_k_indices(self._centroids @ query, self.nprobe)
+                pending = np.arange(self._indexed, self._size)
+                parts = [self._order[self._offsets[c]:self._offsets[c + 1]] for c in probe]
+                parts.append(pending[np.isin(self._assign[pending], probe)])
+                rows = np.concatenate(parts)
+                rows = rows[self._alive[rows]]
+            if len(rows) == 0:
+                return []
+            scores = self._vectors[rows] @ query
+            best = top_k_indices(scores, top_k)
+            return [
+                (self._keys[self._owner[rows[i]]], int(self._local[rows[i]]), float(scores[i]))
+                for i in best
+            ]
+
+    # ---------- persistence ----------
+    def save(self, path):
+        # copy under the lock, write without it: searches are not held up by the disk
+        with self._lock:
+            if self._dead:
+                self._compact()
+            n = self._size
+            arrays = dict(
+                vectors=self._vectors[:n].copy(), owner=self._owner[:n].copy(), local=self._local[:n].copy(),
+                assign=self._assign[:n].copy(), keys=np.array(self._keys, dtype=str),
+                centroids=self._centroids if self._centroids is not None else np.empty((0, self.dim), np.float32),
+                trained_size=np.int64(self._trained_size), nprobe=np.int64(self.nprobe),
+            )
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, min_train_size=MIN_TRAIN_SIZE):
+        with np.load(path) as data:
+            vectors = data["vectors"]
+            index = cls(vectors.shape[1], int(data["nprobe"]), min_train_size)
+            n = len(vectors)
+            index._vectors = vectors
+            index._owner = data["owner"]
+            index._local = data["local"]
+            index._alive = np.ones(n, dtype=bool)
+            index._assign = data["assign"]
+            index._size = n
+            index._keys = [str(k) for k in data["keys"]]
+            index._centroids = data["centroids"] if len(data["centroids"]) else None
+            index._trained_size = int(data["trained_size"])
+        index._index_keys()
+        return index
@@ -0,0 +1,444 @@
+"""
+Persistent store of section embeddings, keyed by PDF content hash.
+
+For every document it keeps the extracted sections in a JSON sidecar and
+their SBERT embeddings in a ``.npy`` matrix that is memory-mapped on load.
+A new persona/job query then only has to encode the query string: stored
+documents are neither re-parsed nor re-encoded.  When a revised version of
+a document comes in, sections whose text did not change reuse the vectors
+stored for its previous version and only the new or edited sections are
+encoded, and the previous version is deleted so corpus searches only see
+the latest version of each file.  Versions are only tracked for files that
+stay on disk (keyed by absolute path, like ``table_store``); uploads are
+stored by content alone.  The store is bounded in size (including the
+corpus search index, which is written in the background) and evicts the
+least recently used documents first.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from ann_index import IVFIndex
+from semantic_utils import DEFAULT_MODEL_DIR, encode_texts, section_text
+
+STORE_DIR = os.environ.get(
+    "PERSONA_EMBEDDING_STORE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "embedding_store"),
+)
+STORE_MAX_MB = float(os.environ.get("PERSONA_EMBEDDING_STORE_MB", "1024"))
+INDEX_SAVE_DELAY = 5.0      # seconds a changed corpus index waits before it is written
+
+
+class EmbeddingStore:
+    """Section embeddings of one SBERT model, one ``.npy``/``.json`` pair per document."""
+
+    def __init__(self, model_id, directory=STORE_DIR, max_bytes=int(STORE_MAX_MB * 1024 * 1024)):
+        # vectors from different models never mix: each gets its own folder
+        model_key = hashlib.sha256(str(model_id).encode("utf-8")).hexdigest()[:16]
+        self.directory = os.path.join(directory, model_key)
+        self.max_bytes = max_bytes
+        self._bytes = None          # lazily measured on first write
+        self._indexes = {}
+        self._unsaved = set()       # kinds whose corpus index changed since it was written
+        self._saver = None
+        self._lock = threading.Lock()
+        self._index_lock = threading.Lock()     # one corpus index sync at a time
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _paths(self, doc_hash, kind):
+        base = os.path.join(self.directory, f"{doc_hash}.{kind}")
+        return f"{base}.npy", f"{base}.json"
+
+    def _index_path(self, kind):
+        return os.path.join(self.directory, f"corpus.{kind}.npz")
+
+    def _names_path(self, kind):
+        # absolute path -> content hash of its latest version; not matched by documents()
+        return os.path.join(self.directory, f"{kind}.names.json")
+
+    def _read_names(self, kind):
+        try:
+            with open(self._names_path(kind), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _remember_names(self, kind, entries):
+        """
+        Record each ``(path, doc_hash)`` of ``entries`` as the latest
+        version of the file at that absolute path and delete the versions
+        they replace (unless another file still has the same content).
+        """
+        with self._lock:
+            names = self._read_names(kind)
+            replaced, changed = set(), False
+            for path, doc_hash in entries:
+                old_hash = names.get(path)
+                if old_hash == doc_hash:
+                    continue
+                if old_hash is not None:
+                    replaced.add(old_hash)
+                names[path] = doc_hash
+                changed = True
+            if not changed:
+                return
+            self._write_names(kind, names)
+            superseded = replaced - set(names.values())
+            index = self._indexes.get(kind)
+        freed = 0
+        for old_hash in superseded:
+            freed += self._delete(old_hash, kind)
+            if index is not None:
+                index.remove(old_hash)
+        if index is not None and superseded:
+            self._schedule_index_save(kind)
+        if freed:
+            with self._lock:
+                if self._bytes is not None:
+                    self._bytes -= freed
+
+    def _write_names(self, kind, names):
+        path = self._names_path(kind)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(names, f)
+        os.replace(tmp_path, path)
+
+    def _delete(self, doc_hash, kind):
+        """Remove a stored document; returns the bytes freed."""
+        matrix_path, meta_path = self._paths(doc_hash, kind)
+        freed = 0
+        # the sidecar goes first: without it the document no longer counts as stored
+        for path in (meta_path, matrix_path):
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                freed += size
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"[WARNING] Failed to delete {os.path.basename(path)}: {e}")
+        return freed
+
+    def _stored_size(self, doc_hash, kind):
+        size = 0
+        for path in self._paths(doc_hash, kind):
+            try:
+                size += os.path.getsize(path)
+            except OSError:
+                pass
+        return size
+
+    def _scan(self):
+        """
+        ``({"<hash>.<kind>": [mtime, bytes, vector bytes]}, total bytes)`` of
+        the stored documents; the total includes the corpus indexes
+        """
+        docs = {}
+        total = 0
+        for entry in os.scandir(self.directory):
+            name = entry.name
+            if name.startswith("corpus.") and name.endswith(".npz"):
+                # a second copy of the vectors: counted, but only shrinks as documents go
+                try:
+                    total += entry.stat().st_size
+                except FileNotFoundError:
+                    pass
+                continue
+            if name.endswith(".npy"):
+                stem = name[:-len(".npy")]
+            elif name.endswith(".json") and not name.endswith(".names.json"):
+                stem = name[:-len(".json")]
+            else:
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            doc = docs.setdefault(stem, [0.0, 0, 0])
+            doc[0] = max(doc[0], stat.st_mtime)
+            doc[1] += stat.st_size
+            if name.endswith(".npy"):
+                doc[2] = stat.st_size
+            total += stat.st_size
+        return docs, total
+
+    def _evict(self, keep=None):
+        """Delete least recently used documents until under the limit; returns them."""
+        docs, total = self._scan()
+        indexed = {kind for kind in {stem.split(".", 1)[1] for stem in docs}
+                   if os.path.exists(self._index_path(kind))}
+        evicted = []
+        index_shrink = 0    # vectors leaving the corpus indexes once they are written again
+        for _, size, vector_size, stem in sorted((mtime, size, vector_size, stem)
+                                                 for stem, (mtime, size, vector_size) in docs.items()):
+            if total - index_shrink <= self.max_bytes:
+                break
+            if stem == keep:
+                continue
+            doc_hash, kind = stem.split(".", 1)
+            self._delete(doc_hash, kind)
+            total -= size
+            if kind in indexed:
+                index_shrink += vector_size
+            evicted.append((doc_hash, kind))
+        self._bytes = total     # the index writes report their own shrink
+        return evicted
+
+    def _forget(self, evicted):
+        """Drop evicted documents from the names index and the corpus index"""
+        by_kind = {}
+        for doc_hash, kind in evicted:
+            by_kind.setdefault(kind, set()).add(doc_hash)
+        for kind, hashes in by_kind.items():
+            with self._lock:
+                names = self._read_names(kind)
+                kept = {path: doc_hash for path, doc_hash in names.items() if doc_hash not in hashes}
+                if len(kept) != len(names):
+                    self._write_names(kind, kept)
+                index = self._indexes.get(kind)
+            if index is not None:
+                for doc_hash in hashes:
+                    index.remove(doc_hash)
+                self._schedule_index_save(kind)
+
+    def _add_bytes(self, delta, keep=None):
+        """Add ``delta`` to the running size and evict documents while over the limit"""
+        with self._lock:
+            if self._bytes is None:
+                self._bytes = self._scan()[1]
+            else:
+                self._bytes += delta
+            evicted = self._evict(keep) if self._bytes > self.max_bytes else []
+        if evicted:
+            self._forget(evicted)
+
+    def previous_vectors(self, path, kind):
+        """``{section text: vector}`` of the latest stored version of the file at ``path``."""
+        doc_hash = self._read_names(kind).get(path)
+        hit = self.load(doc_hash, kind) if doc_hash else None
+        if hit is None:
+            return {}
+        sections, matrix = hit
+        return {section_text(s): matrix[i] for i, s in enumerate(sections)}
+
+    def _read_meta(self, doc_hash, kind):
+        with open(self._paths(doc_hash, kind)[1], "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def load(self, doc_hash, kind):
+        """Return ``(sections, matrix)`` for a stored document, or None."""
+        try:
+            sections = self._read_meta(doc_hash, kind)["sections"]
+            matrix = np.load(self._paths(doc_hash, kind)[0], mmap_mode="r")
+        except (OSError, ValueError, KeyError):
+            return None
+        if matrix.shape[0] != len(sections):
+            return None
+        try:
+            os.utime(self._paths(doc_hash, kind)[1])     # least recently used goes first
+        except OSError:
+            pass
+        return sections, matrix
+
+    def documents(self, kind):
+        """Content hashes of every document stored for ``kind``."""
+        suffix = f".{kind}.json"
+        return [name[:-len(suffix)] for name in os.listdir(self.directory) if name.endswith(suffix)]
+
+    def save(self, doc_hash, kind, sections, matrix, filename=None, path=None):
+        """
+        Store a document's sections (without their "document" name) and
+        embeddings; ``path`` records it as the latest version of that file.
+        """
+        matrix_path, meta_path = self._paths(doc_hash, kind)
+        replaced = self._stored_size(doc_hash, kind)
+        suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(matrix_path + suffix, "wb") as f:
+            np.save(f, np.asarray(matrix, dtype=np.float32))
+        os.replace(matrix_path + suffix, matrix_path)
+        stored = [{k: v for k, v in s.items() if k != "document"} for s in sections]
+        with open(meta_path + suffix, "w", encoding="utf-8") as f:
+            json.dump({"kind": kind, "filename": filename, "count": len(stored), "sections": stored}, f)
+        # the sidecar is written last, so a document only counts as stored
+        # once both files are complete
+        os.replace(meta_path + suffix, meta_path)
+        if path:
+            self._remember_names(kind, [(path, doc_hash)])
+        with self._lock:
+            index = self._indexes.get(kind)
+        if index is not None:
+            index.add(doc_hash, matrix)
+            self._schedule_index_save(kind)
+        self._add_bytes(self._stored_size(doc_hash, kind) - replaced, keep=f"{doc_hash}.{kind}")
+
+    def document_embeddings(self, documents, kind, extract_sections, model, persist=False):
+        """
+        Return ``[(sections, matrix), ...]`` for ``documents``, a list of
+        ``(filename, source, doc_hash)``.
+
+        Stored documents are loaded from disk. The rest are passed to
+        ``extract_sections(missing)``, which returns one section list (or
+        None on failure) per missing document. Their sections are encoded
+        in a single batch and stored. Every section is tagged with the
+        filename it was loaded under. With ``persist``, sources that are
+        paths are tracked as files whose revisions replace each other.
+        """
+        paths = [os.path.abspath(source) if persist and isinstance(source, (str, os.PathLike)) else None
+                 for _, source, _ in documents]
+        groups = [None] * len(documents)
+        missing = []
+        for i, (filename, source, doc_hash) in enumerate(documents):
+            hit = self.load(doc_hash, kind)
+            if hit is None:
+                missing.append(i)
+            else:
+                groups[i] = hit
+        # a stored document may be the new version of a tracked file
+        self._remember_names(kind, [(path, doc_hash) for (_, _, doc_hash), path, group
+                                    in zip(documents, paths, groups) if path and group is not None])
+
+        if missing:
+            extracted = extract_sections([documents[i] for i in missing])
+            texts = [section_text(s) for sections in extracted if sections for s in sections]
+            known = {}
+            for i, sections in zip(missing, extracted):
+                if sections and paths[i]:
+                    known.update(self.previous_vectors(paths[i], kind))
+            matrix = _encode_new(model, texts, known) if texts else None
+            offset = 0
+            for i, sections in zip(missing, extracted):
+                if not sections:
+                    continue
+                doc_matrix = matrix[offset:offset + len(sections)]
+                offset += len(sections)
+                try:
+                    self.save(documents[i][2], kind, sections, doc_matrix, documents[i][0], paths[i])
+                except OSError as e:
+                    print(f"[WARNING] Failed to store embeddings for {documents[i][0]}: {e}")
+                groups[i] = (sections, doc_matrix)
+
+        result = []
+        for (filename, _, _), group in zip(documents, groups):
+            if group is None:
+                continue
+            sections, matrix = group
+            result.append(([dict(s, document=filename) for s in sections], matrix))
+        return result
+
+    # ---------- corpus search ----------
+    def corpus_index(self, kind):
+        """
+        Return the ANN index over every document stored for ``kind``, loading
+        it from disk and bringing it in sync with the stored documents.  The
+        index is written back in the background, not by the caller.
+        """
+        index_path = self._index_path(kind)
+        with self._index_lock:
+            with self._lock:
+                index = self._indexes.get(kind)
+            if index is None and os.path.exists(index_path):
+                try:
+                    index = IVFIndex.load(index_path)
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"[WARNING] Rebuilding corpus index: {e}")
+            stored = set(self.documents(kind))
+            known = set(index.keys()) if index is not None else set()
+            changed = False
+            for doc_hash in known - stored:
+                index.remove(doc_hash)
+                changed = True
+            for doc_hash in stored - known:
+                hit = self.load(doc_hash, kind)
+                if hit is None:
+                    continue
+                if index is None:
+                    index = IVFIndex(hit[1].shape[1])
+                index.add(doc_hash, hit[1])
+                changed = True
+            if index is None:
+                return None
+            with self._lock:
+                self._indexes[kind] = index
+        if changed:
+            self._schedule_index_save(kind)
+        return index
+
+    def _schedule_index_save(self, kind):
+        """Have the corpus index of ``kind`` written by the background saver"""
+        with self._lock:
+            self._unsaved.add(kind)
+            if self._saver is None:
+                self._saver = threading.Thread(target=self._save_indexes, name="corpus-index-saver", daemon=True)
+                self._saver.start()
+
+    def _save_indexes(self):
+        """Background saver: write changed corpus indexes, at most every INDEX_SAVE_DELAY seconds"""
+        while True:
+            time.sleep(INDEX_SAVE_DELAY)
+            with self._lock:
+                kinds, self._unsaved = self._unsaved, set()
+                if not kinds:
+                    self._saver = None
+                    return
+                indexes = [(kind, self._indexes[kind]) for kind in kinds if kind in self._indexes]
+            for kind, index in indexes:
+                path = self._index_path(kind)
+                try:
+                    replaced = os.path.getsize(path) if os.path.exists(path) else 0
+                    index.save(path)
+                    self._add_bytes(os.path.getsize(path) - replaced)
+                except OSError as e:
+                    print(f"[WARNING] Failed to save corpus index: {e}")
+
+    def search(self, query_vector, kind, top_k=10):
+        """Top ``top_k`` stored sections for a query embedding, across the whole corpus."""
+        index = self.corpus_index(kind)
+        if index is None:
+            return []
+        ranked = []
+        metas = {}
+        # hits are named after a file they are currently stored for
+        current = {doc_hash: os.path.basename(path) for path, doc_hash in self._read_names(kind).items()}
+        for doc_hash, row, score in index.search(query_vector, top_k):
+            if doc_hash not in metas:
+                try:
+                    metas[doc_hash] = self._read_meta(doc_hash, kind)
+                except (OSError, ValueError):
+                    continue
+            meta = metas[doc_hash]
+            filename = current.get(doc_hash) or meta.get("filename") or doc_hash
+            ranked.append(dict(meta["sections"][row], document=filename, score=score))
+        return ranked
+
+
+def _encode_new(model, texts, known):
+    """Embeddings of ``texts``, encoding only (once each) those not in ``known``"""
+    new_texts = list(dict.fromkeys(text for text in texts if text not in known))
+    if new_texts:
+        known = {**known, **dict(zip(new_texts, encode_texts(model, new_texts)))}
+    return np.stack([np.asarray(known[text], dtype=np.float32) for text in texts])
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_embedding_store(model_dir=None):
+    """Return the process-wide store for a local SBERT model, or None if unavailable."""
+    model_dir = os.path.abspath(model_dir or DEFAULT_MODEL_DIR)
+    with _stores_lock:
+        if model_dir not in _stores:
+            try:
+                # a model replaced in place gets a fresh folder
+                model_id = f"{model_dir}:{os.path.getmtime(os.path.join(model_dir, 'config.json'))}"
+                _stores[model_dir] = EmbeddingStore(model_id)
+            except OSError as e:
+                print(f"[WARNING] Embedding store unavailable: {e}")
+                _stores[model_dir] = None
+        return _stores[model_dir]
@@ -1,35 +1,139 @@
 import os, json, datetime
 import sys
+import hashlib
+import threading
+from collections import OrderedDict
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from heading_utils import extract_headings_and_text
-from semantic_utils import rank_sections_by_similarity
+from semantic_utils import (rank_sections_by_similarity, rank_embedded_sections, get_sentence_model,
+                            sentence_model_id, encode_texts)
+from embedding_store import get_embedding_store
 
 INPUT_DIR = "input"
 OUTPUT_DIR = "output"
+EXTRACTOR_VERSION = "2"   # bump when extract_persona_insight_from_file output changes
+HEADING_SECTIONS = "headings-v2"      # embedding store kinds; bump when the
+PARAGRAPH_SECTIONS = "paragraphs-v1"  # matching section extraction changes
+SECTION_WORKERS = int(os.environ.get("PERSONA_SECTION_WORKERS", os.cpu_count() or 1))
 
 os.environ["HF_HOME"] = os.path.expanduser("~/.cache/huggingface")
-try:
-    from transformers import pipeline, AutoTokenizer, AutoModelForSeq2SeqLM
-    summarizer_model_path = os.path.join(os.path.dirname(__file__), 'pretrained_summarizer')
-    if not os.path.exists(summarizer_model_path):
-        print(f"[ERROR] Local summarization model not found at {summarizer_model_path}. Please download and place it here before running offline.")
-        summarizer = None
-    else:
-        summarizer = pipeline("summarization", model=summarizer_model_path, tokenizer=summarizer_model_path)
-    def summarize_text(text):
-        if summarizer is None or len(text) < 50:
-            return text[:300] + ("..." if len(text) > 300 else "")
+SUMMARIZER_MODEL_PATH = os.path.join(os.path.dirname(__file__), 'pretrained_summarizer')
+SUMMARY_INPUT_CHARS = 1024      # longer texts are summarized from their start
+SUMMARY_BATCH_SIZE = int(os.environ.get("PERSONA_SUMMARY_BATCH_SIZE", "8"))
+SUMMARY_THREADS = int(os.environ.get("PERSONA_SUMMARY_THREADS", "0"))   # 0 = library default
+SUMMARY_CACHE_SIZE = 1024
+_summarizer = None
+_summarizer_loaded = False
+_summarizer_lock = threading.Lock()
+
+def get_summarizer():
+    """
+    Return the local summarization pipeline, or None if it is unavailable.
+    transformers and the model are loaded on first use, not at import, so
+    callers that never summarize do not pay for them.
+    """
+    global _summarizer, _summarizer_loaded
+    with _summarizer_lock:
+        if not _summarizer_loaded:
+            _summarizer_loaded = True
+            try:
+                from transformers import pipeline
+            except ImportError:
+                print("[WARNING] transformers not installed, using longer snippet instead of summary.")
+                return None
+            if not os.path.exists(SUMMARIZER_MODEL_PATH):
+                print(f"[ERROR] Local summarization model not found at {SUMMARIZER_MODEL_PATH}. Please download and place it here before running offline.")
+            else:
+                try:
+                    _summarizer = pipeline("summarization", model=SUMMARIZER_MODEL_PATH, tokenizer=SUMMARIZER_MODEL_PATH)
+                except Exception as e:
+                    print(f"[WARNING] Failed to load summarization model: {e}. Using snippets.")
+            if _summarizer is not None and SUMMARY_THREADS > 0:
+                try:
+                    import torch
+                    torch.set_num_threads(SUMMARY_THREADS)
+                except ImportError:
+                    pass
+        return _summarizer
+
+_summary_cache = OrderedDict()   # hash of the summarized input -> summary
+_summary_cache_lock = threading.Lock()
+
+def _snippet(text):
+    return text[:300] + ("..." if len(text) > 300 else "")
+
+def _run_summarizer(summarizer, texts):
+    """Summaries of ``texts`` from one batched pipeline call, falling back to one call per text"""
+    kwargs = dict(max_length=60, min_length=20, do_sample=False)
+    try:
+        return [r['summary_text'] for r in summarizer(texts, batch_size=len(texts), **kwargs)]
+    except Exception as e:
+        if len(texts) > 1:
+            print(f"[WARNING] Batched summarization failed: {e}. Retrying one by one.")
+    summaries = []
+    for text in texts:
         try:
-            summary = summarizer(text[:1024], max_length=60, min_length=20, do_sample=False)[0]['summary_text']
-            return summary
+            summaries.append(summarizer(text, **kwargs)[0]['summary_text'])
         except Exception as e:
             print(f"[WARNING] Summarization failed: {e}. Using snippet.")
-            return text[:300] + ("..." if len(text) > 300 else "")
-except ImportError:
-    summarizer = None
-    def summarize_text(text):
-        print("[WARNING] transformers not installed, using longer snippet instead of summary.")
-        return text[:300] + ("..." if len(text) > 300 else "")
+            summaries.append(None)
+    return summaries
+
+def summarize_texts(texts):
+    """
+    Summaries of ``texts``, in order. Identical inputs are summarized once,
+    summaries are memoized by input hash, and the remaining inputs run
+    through the pipeline in batches of similar length (less padding).
+    Texts that are too short or cannot be summarized get a snippet.
+    """
+    summaries = [None] * len(texts)
+    pending = {}   # key -> (input, indices)
+    for i, text in enumerate(texts):
+        if len(text) < 50:
+            summaries[i] = _snippet(text)
+            continue
+        source = text[:SUMMARY_INPUT_CHARS]
+        key = hashlib.sha1(source.encode("utf-8", "surrogatepass")).hexdigest()
+        with _summary_cache_lock:
+            cached = _summary_cache.get(key)
+            if cached is not None:
+                _summary_cache.move_to_end(key)
+        if cached is not None:
+            summaries[i] = cached
+        else:
+            pending.setdefault(key, (source, []))[1].append(i)
+
+    summarizer = get_summarizer() if pending else None
+    if summarizer is not None:
+        keys = sorted(pending, key=lambda k: len(pending[k][0]))
+        for start in range(0, len(keys), SUMMARY_BATCH_SIZE):
+            batch = keys[start:start + SUMMARY_BATCH_SIZE]
+            results = _run_summarizer(summarizer, [pending[k][0] for k in batch])
+            for key, summary in zip(batch, results):
+                if summary is None:
+                    continue
+                with _summary_cache_lock:
+                    _summary_cache[key] = summary
+                    while len(_summary_cache) > SUMMARY_CACHE_SIZE:
+                        _summary_cache.popitem(last=False)
+                for i in pending[key][1]:
+                    summaries[i] = summary
+    return [summary if summary is not None else _snippet(text) for summary, text in zip(summaries, texts)]
+
+def summarize_text(text):
+    return summarize_texts([text])[0]
+
+def persona_error(persona_dict):
+    """Message if ``persona_dict`` lacks the "persona" or "job_to_be_done" field, else None"""
+    if not isinstance(persona_dict, dict):
+        return 'Persona JSON must be an object with "persona" and "job_to_be_done"'
+    missing = [f'"{field}"' for field in ("persona", "job_to_be_done") if field not in persona_dict]
+    if missing:
+        return f"Persona JSON is missing {' and '.join(missing)}"
+    return None
 
 def load_persona_job():
     persona_path = os.path.join(INPUT_DIR, "persona.json")
@@ -38,16 +142,50 @@ def load_persona_job():
         sys.exit(1)
     with open(persona_path, "r") as f:
         data = json.load(f)
+    error = persona_error(data)
+    if error:
+        print(f"[ERROR] {error} ({persona_path}).")
+        sys.exit(1)
     return data["persona"], data["job_to_be_done"]
 
-def extract_persona_insight_from_file(pdf_path, persona_dict):
+def extract_persona_insight_from_file(pdf_path, persona_dict, use_cache=True, filename=None):
+    """
+    Rank the sections of one PDF for a persona. ``pdf_path`` may also be the
+    raw PDF bytes, in which case ``filename`` names the document in the output.
+    """
+    error = persona_error(persona_dict)
+    if error:
+        return {"error": error}
+    try:
+        from outline_extractor.cache_utils import cached_extraction
+    except ImportError as e:
+        return {"error": f"Failed to import cache_utils: {e}"}
+    if filename is None:
+        filename = os.path.basename(pdf_path) if isinstance(pdf_path, (str, os.PathLike)) else "document.pdf"
+    params = {
+        "persona": persona_dict.get("persona"),
+        "job_to_be_done": persona_dict.get("job_to_be_done"),
+        "document": filename,
+        # the model is only loaded on a miss
+        "ranker": sentence_model_id() or "bm25",
+    }
+    result = cached_extraction(
+        pdf_path, "persona_insight", EXTRACTOR_VERSION, params,
+        lambda: _extract_persona_insight(pdf_path, persona_dict, filename), use_cache,
+    )
+    if "error" not in result:
+        # a cached result is stamped with this request, not the run that computed it
+        result["metadata"]["timestamp"] = datetime.datetime.now().isoformat()
+    return result
+
+def _extract_persona_insight(pdf_path, persona_dict, filename):
     try:
         import fitz  # PyMuPDF
     except ImportError:
         return {"error": "PyMuPDF (fitz) is not installed. Please install it with 'pip install pymupdf'."}
     
     try:
-        from semantic_utils import rank_sections_by_similarity
+        from semantic_utils import rank_sections_by_similarity, get_sentence_model
     except ImportError as e:
         return {"error": f"Failed to import semantic_utils: {e}"}
     
@@ -57,104 +195,84 @@ def extract_persona_insight_from_file(pdf_path, persona_dict):
     persona = persona_dict["persona"]
     job = persona_dict["job_to_be_done"]
     combined_query = f"{persona}. Task: {job}"
-    filename = os.path.basename(pdf_path)
     
     try:
-        # Simple text extraction without complex heading detection
-        doc = fitz.open(pdf_path)
-        sections = []
-        
-        for page_num, page in enumerate(doc, start=1):
-            text = page.get_text()
-            if text.strip():
-                # Split text into paragraphs
-                paragraphs = [p.strip() for p in text.split('\n\n') if p.strip() and len(p.strip()) > 20]
-                
-                for i, paragraph in enumerate(paragraphs[:5]):  # Limit to 5 paragraphs per page
-                    sections.append({
-                        "title": f"Page {page_num} - Paragraph {i+1}",
-                        "text": paragraph[:500],  # Limit text length
-                        "page": page_num,
-                        "document": filename
-                    })
-        
-        if not sections:
+        model = get_sentence_model()
+        ranked = None
+        if model is not None:
+            ranked = _rank_stored_sections(
+                [(filename, pdf_path)], PARAGRAPH_SECTIONS,
+                lambda missing: [_paragraph_sections(pdf_path, filename) or None],
+                combined_query, model, top_k=10,
+            )
+        if ranked is None:
+            # Rank sections by similarity
+            sections = _paragraph_sections(pdf_path, filename)
+            ranked = rank_sections_by_similarity(sections, combined_query, model, top_k=10)
+        if not ranked:
             return {"error": "No text content extracted from PDF."}
-            
-        # Rank sections by similarity
-        ranked = rank_sections_by_similarity(sections, combined_query)
-        
-        output = {
-            "metadata": {
-                "document": filename,
-                "persona": persona,
-                "job_to_be_done": job,
-                "timestamp": datetime.datetime.now().isoformat()
-            },
-            "sections": [],
-            "subsection_analysis": []
-        }
-        
-        for i, item in enumerate(ranked[:10]):
-            output["sections"].append({
-                "document": item["document"],
-                "page": item["page"],
-                "section_title": item["title"],
-                "importance_rank": i+1
-            })
-            output["subsection_analysis"].append({
-                "document": item["document"],
-                "page": item["page"],
-                "refined_text": item["text"],
-                "importance_rank": i+1
-            })
         
-        return output
+        return build_ranked_output(ranked, {
+            "document": filename,
+            "persona": persona,
+            "job_to_be_done": job,
+            "timestamp": datetime.datetime.now().isoformat()
+        })
         
     except Exception as e:
         return {"error": f"Failed to process {filename}: {str(e)}"}
 
-def main():
-    if not os.path.exists(INPUT_DIR):
-        print(f"[ERROR] Input folder '{INPUT_DIR}' does not exist.")
-        sys.exit(1)
-    if not os.path.exists(OUTPUT_DIR):
-        print(f"[INFO] Output folder '{OUTPUT_DIR}' does not exist. Creating it.")
-        os.makedirs(OUTPUT_DIR)
-    persona, job = load_persona_job()
-    combined_query = f"{persona}. Task: {job}"
+def _paragraph_sections(pdf_path, filename):
+    """Simple text extraction without complex heading detection"""
+    from outline_extractor.layout_utils import get_line_table
 
-    pdfs = [f for f in os.listdir(INPUT_DIR) if f.lower().endswith('.pdf')]
-    if not pdfs:
-        print(f"[WARNING] No PDF files found in '{INPUT_DIR}'.")
-        return
-    all_sections = []
-    for filename in pdfs:
-        doc_path = os.path.join(INPUT_DIR, filename)
-        try:
-            doc_sections = extract_headings_and_text(doc_path, filename)
-            all_sections.extend(doc_sections)
-        except Exception as e:
-            print(f"[ERROR] Failed to process {filename}: {e}")
-    if not all_sections:
-        print("[WARNING] No sections extracted from any PDF.")
-        return
+    table = get_line_table(pdf_path)
+    sections = []
+    
+    for page_num in range(1, table.page_count + 1):
+        start, end = table.page_range(page_num)
+        text = "\n".join(table.texts(start, end))
+        if text.strip():
+            # Split text into paragraphs
+            paragraphs = [p.strip() for p in text.split('\n\n') if p.strip() and len(p.strip()) > 20]
+            
+            for i, paragraph in enumerate(paragraphs[:5]):  # Limit to 5 paragraphs per page
+                sections.append({
+                    "title": f"Page {page_num} - Paragraph {i+1}",
+                    "text": paragraph[:500],  # Limit text length
+                    "page": page_num,
+                    "document": filename
+                })
+    return sections
+
+def _rank_stored_sections(documents, kind, extract_missing, query, model, top_k=None, persist=False):
+    """
+    Rank the sections of ``documents`` (``(filename, source)`` pairs) using
+    section embeddings from the persistent store, so documents seen before
+    are neither parsed nor encoded again. ``persist`` tracks revisions of
+    paths that stay on disk. Returns None when the store is unavailable or
+    fails, so the caller can rank the plain way.
+    """
+    store = get_embedding_store()
+    if store is None:
+        return None
     try:
-        ranked = rank_sections_by_similarity(all_sections, combined_query)
+        from outline_extractor.cache_utils import content_hash
+        hashed = [(filename, source, content_hash(source)) for filename, source in documents]
+        groups = store.document_embeddings(hashed, kind, extract_missing, model, persist)
+        return rank_embedded_sections(groups, query, model, top_k)
     except Exception as e:
-        print(f"[ERROR] Failed to rank sections by similarity: {e}")
-        return
+        print(f"[WARNING] Embedding store failed: {e}. Ranking without it.")
+        return None
+
+def build_ranked_output(ranked, metadata, top_k=10):
+    """Challenge-1b output JSON for the first ``top_k`` ranked sections."""
     output = {
-        "metadata": {
-            "documents": pdfs,
-            "persona": persona,
-            "job_to_be_done": job,
-            "timestamp": datetime.datetime.now().isoformat()
-        },
+        "metadata": metadata,
         "sections": [],
         "subsection_analysis": []
     }
-    for i, item in enumerate(ranked[:10]):
+    for i, item in enumerate(ranked[:top_k]):
         output["sections"].append({
             "document": item["document"],
             "page": item["page"],
@@ -167,6 +285,182 @@ def main():
             "refined_text": item["text"],
             "importance_rank": i+1
         })
+    return output
+
+_section_pool = None
+_section_pool_lock = threading.Lock()
+
+def _get_section_pool():
+    global _section_pool
+    with _section_pool_lock:
+        if _section_pool is None:
+            # Forking is only safe while this is the sole thread (the CLI);
+            # the API calls in from request threads, so it spawns instead.
+            method = "fork" if threading.active_count() == 1 and "fork" in multiprocessing.get_all_start_methods() else "spawn"
+            _section_pool = ProcessPoolExecutor(
+                max_workers=SECTION_WORKERS, mp_context=multiprocessing.get_context(method)
+            )
+        return _section_pool
+
+def extract_sections_from_files(documents, workers=None, persist=False):
+    """
+    Extract heading sections from several PDFs, in parallel worker processes
+    when there is more than one document.
+
+    documents: list of ``(filename, source)`` where source is a path or PDF bytes.
+    Returns ``(sections, errors)``; errors maps filename to a message.
+    ``persist`` stores the parsed tables of paths that stay on disk.
+    """
+    sections, errors = [], {}
+    for filename, doc_sections, error in _extract_sections_per_file(documents, workers, persist):
+        if error is not None:
+            errors[filename] = str(error)
+        else:
+            sections.extend(doc_sections)
+    return sections, errors
+
+def _extract_sections_per_file(documents, workers=None, persist=False):
+    """Return ``[(filename, sections, error), ...]`` in the order of ``documents``"""
+    workers = SECTION_WORKERS if workers is None else workers
+    if workers <= 1 or len(documents) <= 1:
+        results = []
+        for filename, source in documents:
+            try:
+                results.append((filename, extract_headings_and_text(source, filename, persist), None))
+            except Exception as e:
+                results.append((filename, None, e))
+    else:
+        pool = _get_section_pool()
+        futures = [(filename, pool.submit(extract_headings_and_text, source, filename, persist))
+                   for filename, source in documents]
+        results = []
+        for filename, future in futures:
+            try:
+                results.append((filename, future.result(), None))
+            except Exception as e:
+                results.append((filename, None, e))
+    return results
+
+def rank_sections_from_files(documents, query, model=None, top_k=None, persist=False):
+    """
+    Extract and rank the heading sections of several PDFs against ``query``,
+    keeping the best ``top_k`` (all when None). With an SBERT model the
+    section embeddings come from the persistent store, so only documents
+    not seen before are parsed and encoded.  ``persist`` stores the parsed
+    tables of paths that stay on disk (see ``get_line_table``).
+
+    Returns ``(ranked, errors)``; errors maps filename to a message.
+    """
+    if model is not None:
+        errors = {}
+
+        def extract_missing(missing):
+            extracted = []
+            for filename, doc_sections, error in _extract_sections_per_file(
+                    [(filename, source) for filename, source, _ in missing], persist=persist):
+                if error is not None:
+                    errors[filename] = str(error)
+                extracted.append(doc_sections)
+            return extracted
+
+        ranked = _rank_stored_sections(documents, HEADING_SECTIONS, extract_missing, query, model, top_k, persist)
+        if ranked is not None:
+            return ranked, errors
+    sections, errors = extract_sections_from_files(documents, persist=persist)
+    return rank_sections_by_similarity(sections, query, model, top_k), errors
+
+def extract_persona_insight_from_files(documents, persona_dict, top_k=10, persist=False):
+    """
+    Rank the sections of several PDFs for one persona in a single global
+    ranking, as the CLI does for the whole input folder.
+
+    documents: list of ``(filename, source)`` where source is a path or PDF bytes.
+    persist: store parsed tables of paths that stay on disk (the watch folder).
+    """
+    error = persona_error(persona_dict)
+    if error:
+        return {"error": error}
+    persona = persona_dict["persona"]
+    job = persona_dict["job_to_be_done"]
+    combined_query = f"{persona}. Task: {job}"
+    try:
+        ranked, errors = rank_sections_from_files(documents, combined_query, get_sentence_model(), top_k, persist)
+    except Exception as e:
+        return {"error": f"Failed to extract sections: {str(e)}"}
+    if not ranked:
+        return {"error": "No sections extracted from any PDF.", "failed_documents": errors}
+    output = build_ranked_output(ranked, {
+        "documents": [filename for filename, _ in documents],
+        "persona": persona,
+        "job_to_be_done": job,
+        "timestamp": datetime.datetime.now().isoformat()
+    }, top_k)
+    if errors:
+        output["metadata"]["failed_documents"] = errors
+    return output
+
+def search_corpus(persona_dict, top_k=10):
+    """
+    Rank sections across every document whose embeddings are in the store
+    (all PDFs ranked before with the SBERT model), using the approximate
+    nearest-neighbour corpus index instead of scoring each section.
+    """
+    error = persona_error(persona_dict)
+    if error:
+        return {"error": error}
+    model = get_sentence_model()
+    store = get_embedding_store() if model is not None else None
+    if store is None:
+        return {"error": "Corpus search needs the local SBERT model (pretrained_model/)."}
+    persona = persona_dict["persona"]
+    job = persona_dict["job_to_be_done"]
+    try:
+        query_vector = encode_texts(model, [f"{persona}. Task: {job}"])[0]
+        ranked = store.search(query_vector, HEADING_SECTIONS, top_k)
+    except Exception as e:
+        return {"error": f"Corpus search failed: {str(e)}"}
+    return build_ranked_output(ranked, {
+        "corpus_documents": len(store.documents(HEADING_SECTIONS)),
+        "persona": persona,
+        "job_to_be_done": job,
+        "timestamp": datetime.datetime.now().isoformat()
+    }, top_k)
+
+def main():
+    if not os.path.exists(INPUT_DIR):
+        print(f"[ERROR] Input folder '{INPUT_DIR}' does not exist.")
+        sys.exit(1)
+    if not os.path.exists(OUTPUT_DIR):
+        print(f"[INFO] Output folder '{OUTPUT_DIR}' does not exist. Creating it.")
+        os.makedirs(OUTPUT_DIR)
+    persona, job = load_persona_job()
+    combined_query = f"{persona}. Task: {job}"
+
+    pdfs = [f for f in os.listdir(INPUT_DIR) if f.lower().endswith('.pdf')]
+    if not pdfs:
+        print(f"[WARNING] No PDF files found in '{INPUT_DIR}'.")
+        return
+    model = get_sentence_model()
+    print(f"[INFO] Ranking sections with {'SBERT embeddings' if model is not None else 'BM25 keyword scoring (no local SBERT model found)'}.")
+    try:
+        ranked, errors = rank_sections_from_files(
+            [(filename, os.path.join(INPUT_DIR, filename)) for filename in pdfs], combined_query, model,
+            persist=True,
+        )
+    except Exception as e:
+        print(f"[ERROR] Failed to rank sections by similarity: {e}")
+        return
+    for filename, error in errors.items():
+        print(f"[ERROR] Failed to process {filename}: {error}")
+    if not ranked:
+        print("[WARNING] No sections extracted from any PDF.")
+        return
+    output = build_ranked_output(ranked, {
+        "documents": pdfs,
+        "persona": persona,
+        "job_to_be_done": job,
+        "timestamp": datetime.datetime.now().isoformat()
+    })
     # Group ranked sections by document
     persona_outline = {}
     for item in ranked:
@@ -185,14 +479,14 @@ def main():
     print("==============================")
     print(f"Persona: {persona}")
     print(f"Job to be done: {job}\n")
+    # one batched summarization pass serves both listings below
+    summaries = summarize_texts([item['text'] for item in ranked[:10]])
     print("--- Top 10 Ranked Sections (Personalized) ---")
-    for i, item in enumerate(ranked[:10]):
-        summary = summarize_text(item['text'])
+    for i, (item, summary) in enumerate(zip(ranked, summaries)):
         print(f"{i+1}. [{item['document']}] Page {item['page']} - {item['title']}")
         print(f"   Summary: {summary}\n")
     print("--- Sub-section Analysis (Summaries) ---")
-    for i, item in enumerate(ranked[:10]):
-        summary = summarize_text(item['text'])
+    for i, (item, summary) in enumerate(zip(ranked, summaries)):
         print(f"{i+1}. [{item['document']}] Page {item['page']} - {item['title']}")
         print(f"   Sub-section summary: {summary}\n")
     print("--- Persona-based Outline (Top 5 per Document) ---")
@@ -112,7 +112,7 @@ class PersonaInsightGUI:
                 self.status_label.config(text="No sections found", fg="red")
                 self.result_text.insert(tk.END, "No sections extracted from the PDFs.")
                 return
-            ranked = rank_sections_by_similarity(all_sections, combined_query)
+            ranked = rank_sections_by_similarity(all_sections, combined_query, self.model, top_k=10)
             output = {
                 "metadata": {
                     "documents": [os.path.basename(f) for f in self.pdf_files],
@@ -1,24 +1,22 @@
-import fitz  # PyMuPDF
+try:
+    from outline_extractor.layout_utils import get_line_table
+except ImportError:
+    import os, sys
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from outline_extractor.layout_utils import get_line_table
 
-def extract_headings_and_text(path, filename):
-    doc = fitz.open(path)
+def extract_headings_and_text(path, filename, persist=False):
+    table = get_line_table(path, persist=persist)
     sections = []
-    for page_num, page in enumerate(doc, start=1):
-        blocks = page.get_text("dict")["blocks"]
-        lines = []
-        for block in blocks:
-            for line in block.get("lines", []):
-                text = " ".join(span["text"] for span in line["spans"] if span["text"].strip()).strip()
-                if text:
-                    lines.append((text, line["spans"][0]["size"], page_num))
+    for page_num in range(1, table.page_count + 1):
+        start, end = table.page_range(page_num)
+        # sized by their first span, not the largest one (see LineTable.first_sizes)
+        lines = list(zip(table.texts(start, end), table.first_sizes[start:end].tolist()))
         # Heuristic: headings are lines with large font size and short length
         if not lines:
             continue
-        font_sizes = [size for _, size, _ in lines]
-        if not font_sizes:
-            continue
-        max_font = max(font_sizes)
-        heading_candidates = [i for i, (text, size, _) in enumerate(lines) if size >= max_font - 1 and len(text.split()) <= 12]
+        max_font = max(size for _, size in lines)
+        heading_candidates = [i for i, (text, size) in enumerate(lines) if size >= max_font - 1 and len(text.split()) <= 12]
         heading_candidates.append(len(lines))  # sentinel for last section
         for idx in range(len(heading_candidates) - 1):
             i = heading_candidates[idx]
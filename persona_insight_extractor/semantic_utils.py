@@ -1,34 +1,104 @@
-import re
-from collections import Counter
-
-def simple_similarity(text1, text2):
-    """Simple text similarity based on word overlap"""
-    words1 = set(re.findall(r'\w+', text1.lower()))
-    words2 = set(re.findall(r'\w+', text2.lower()))
-    
-    if not words1 or not words2:
-        return 0.0
-    
-    intersection = words1.intersection(words2)
-    union = words1.union(words2)
-    
-    return len(intersection) / len(union) if union else 0.0
-
-def rank_sections_by_similarity(sections, query):
-    """Rank sections by similarity to query using simple text matching"""
+import os
+import threading
+
+import numpy as np
+
+try:
+    from outline_extractor.ranking_utils import get_bm25_index, top_k_indices, select_top_k
+except ImportError:
+    import sys
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from outline_extractor.ranking_utils import get_bm25_index, top_k_indices, select_top_k
+
+DEFAULT_MODEL_DIR = os.environ.get(
+    "PERSONA_SBERT_MODEL",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "pretrained_model"),
+)
+ENCODE_BATCH_SIZE = 64
+
+_models = {}
+_models_lock = threading.Lock()
+
+def get_sentence_model(model_dir=None):
+    """Load (once per process) the local SBERT model, or return None if unavailable"""
+    model_dir = model_dir or DEFAULT_MODEL_DIR
+    with _models_lock:
+        if model_dir not in _models:
+            model = None
+            if os.path.exists(os.path.join(model_dir, "config.json")):
+                try:
+                    from sentence_transformers import SentenceTransformer
+                    model = SentenceTransformer(model_dir)
+                except Exception as e:
+                    print(f"[WARNING] Failed to load SBERT model from {model_dir}: {e}")
+            _models[model_dir] = model
+        return _models[model_dir]
+
+def sentence_model_id(model_dir=None):
+    """
+    Identifier (path and modification time) of the local SBERT model that
+    get_sentence_model would use, without loading it; None if there is none
+    """
+    model_dir = model_dir or DEFAULT_MODEL_DIR
+    with _models_lock:
+        if model_dir in _models and _models[model_dir] is None:
+            return None                 # present, but failed to load
+    try:
+        return f"{os.path.abspath(model_dir)}:{os.path.getmtime(os.path.join(model_dir, 'config.json'))}"
+    except OSError:
+        return None
+
+def section_text(section):
+    return f"{section['title']} - {section['text']}"
+
+def encode_texts(model, texts, batch_size=ENCODE_BATCH_SIZE):
+    """Encode texts into one L2-normalised float32 matrix (one row per text)"""
+    embeddings = model.encode(
+        texts,
+        batch_size=batch_size,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+        show_progress_bar=False,
+    )
+    return np.asarray(embeddings, dtype=np.float32)
+
+def rank_sections_by_embedding(sections, query, model, top_k=None, batch_size=ENCODE_BATCH_SIZE):
+    """Rank sections by cosine similarity between SBERT embeddings and the query"""
+    if not sections:
+        return []
+    section_matrix = encode_texts(model, [section_text(s) for s in sections], batch_size)
+    query_vector = encode_texts(model, [query])[0]
+    scores = section_matrix @ query_vector
+    return select_top_k(sections, scores, top_k)
+
+def rank_embedded_sections(groups, query, model, top_k=None):
+    """Rank ``(sections, embedding matrix)`` groups whose embeddings are precomputed; only the query is encoded"""
+    sections = [s for group_sections, _ in groups for s in group_sections]
+    if not sections:
+        return []
+    query_vector = encode_texts(model, [query])[0]
+    scores = np.concatenate([np.asarray(matrix @ query_vector) for _, matrix in groups])
+    return select_top_k(sections, scores, top_k)
+
+def rank_sections_by_similarity(sections, query, model=None, top_k=None):
+    """
+    Rank sections by similarity to query: SBERT embeddings when a model is
+    given, BM25 keyword scoring otherwise. Only the best ``top_k`` sections
+    are returned (all when top_k is None)
+    """
+    if model is not None:
+        try:
+            return rank_sections_by_embedding(sections, query, model, top_k)
+        except Exception as e:
+            print(f"Error in embedding ranking: {e}. Falling back to text matching.")
     try:
-        # Calculate similarity scores
-        scored_sections = []
-        for section in sections:
-            section_text = f"{section['title']} - {section['text']}"
-            similarity = simple_similarity(query, section_text)
-            scored_sections.append((similarity, section))
+        # Score every section against the query through one inverted index
+        scores = get_bm25_index([section_text(section) for section in sections]).scores(query)
         
-        # Sort by similarity score (descending)
-        ranked = sorted(scored_sections, key=lambda x: x[0], reverse=True)
-        return [section for _, section in ranked]
+        # Select the best sections by similarity score (descending)
+        return select_top_k(sections, scores, top_k)
         
     except Exception as e:
         print(f"Error in similarity ranking: {e}")
         # Fallback: return sections in original order
-        return sections
+        return sections[:top_k]
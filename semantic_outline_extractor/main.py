@@ -7,27 +7,48 @@ import time
 
 INPUT_DIR = Path("input")
 OUTPUT_DIR = Path("output")
-OUTPUT_DIR.mkdir(exist_ok=True)
+EXTRACTOR_VERSION = "1"   # bump when extract_outline output changes
 
-def extract_semantic_outline_from_file(pdf_path):
+def extract_semantic_outline_from_file(pdf_path, use_cache=True, pages=None, max_headings=None, persist=False):
+    """
+    Extract the semantic outline of a PDF given as a path or as raw bytes,
+    optionally limited to ``pages`` (e.g. "1-20") and ``max_headings``.
+    ``persist`` stores the parsed table of a path that stays on disk.
+    """
     try:
         from .utils import extract_outline
+        from outline_extractor.cache_utils import cached_extraction
+        from outline_extractor.layout_utils import parse_page_range
     except ImportError as e:
         return {"error": f"Failed to import utils: {e}"}
-    
     try:
-        title, outline = extract_outline(pdf_path)
-        return {"title": title, "outline": outline}
-    except Exception as e:
-        return {"error": f"Failed to extract semantic outline: {str(e)}"}
+        pages = parse_page_range(pages)
+    except ValueError as e:
+        return {"error": str(e)}
+    
+    def compute():
+        try:
+            title, outline = extract_outline(pdf_path, pages, max_headings, persist)
+            return {"title": title, "outline": outline}
+        except Exception as e:
+            return {"error": f"Failed to extract semantic outline: {str(e)}"}
+    params = None
+    if pages is not None or max_headings is not None:
+        params = {"pages": pages, "max_headings": max_headings}
+    return cached_extraction(pdf_path, "semantic_outline", EXTRACTOR_VERSION, params, compute, use_cache)
 
-for pdf_path in INPUT_DIR.glob("*.pdf"):
-    print(f"\n📄 Processing: {pdf_path.name}")
-    start = time.time()
-    try:
-        title, outline = extract_outline(str(pdf_path))
-        with open(OUTPUT_DIR / f"{pdf_path.stem}.json", "w", encoding="utf-8") as f:
-            json.dump({"title": title, "outline": outline}, f, indent=2)
-        print(f"✅ Done: {pdf_path.name} | Title: {title} | Headings: {len(outline)} | Time: {time.time() - start:.2f}s")
-    except Exception as e:
-        print(f"❌ Error in {pdf_path.name}: {e}")
+def main():
+    OUTPUT_DIR.mkdir(exist_ok=True)
+    for pdf_path in INPUT_DIR.glob("*.pdf"):
+        print(f"\n📄 Processing: {pdf_path.name}")
+        start = time.time()
+        try:
+            title, outline = extract_outline(str(pdf_path), persist=True)
+            with open(OUTPUT_DIR / f"{pdf_path.stem}.json", "w", encoding="utf-8") as f:
+                json.dump({"title": title, "outline": outline}, f, indent=2)
+            print(f"✅ Done: {pdf_path.name} | Title: {title} | Headings: {len(outline)} | Time: {time.time() - start:.2f}s")
+        except Exception as e:
+            print(f"❌ Error in {pdf_path.name}: {e}")
+
+if __name__ == "__main__":
+    main()
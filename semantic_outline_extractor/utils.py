@@ -1,38 +1,48 @@
 # utils.py
 
-import fitz  # PyMuPDF
 import numpy as np
-from sklearn.cluster import KMeans
 from pathlib import Path
-
-def extract_outline(pdf_path):
+from outline_extractor.layout_utils import PageRangeError, get_line_table
+from outline_extractor.level_utils import cluster_labels
+
+def _is_candidate(text, font_size):
+    """Whether a line can be a heading: short, not sentence-like, font of 8pt or more"""
+    return len(text) >= 4 and font_size >= 8 and len(text.split()) <= 15 and text[-1] not in ".:;"
+
+def extract_outline(pdf_path, pages=None, max_headings=None, persist=False):
+    """
+    Return ``(title, outline)``. ``pages`` limits it to a page range; with
+    ``max_headings`` parsing stops once the pages read so far hold enough
+    candidate headings, and the outline keeps the first ``max_headings``.
+    ``persist`` stores the parsed table of a path for incremental re-runs.
+    """
     try:
-        doc = fitz.open(pdf_path)
-        lines = []
-
-        for page_num, page in enumerate(doc):
-            blocks = page.get_text("dict")["blocks"]
-            for block in blocks:
-                for line in block.get("lines", []):
-                    text = " ".join(span["text"] for span in line["spans"]).strip()
-                    if not text or len(text) < 4:
-                        continue
+        def enough_candidates(partial):
+            # one extra for the title, which is dropped from the outline
+            found = sum(_is_candidate(text, size) for text, size in zip(partial.texts(), partial.sizes.tolist()))
+            return found > max_headings
 
-                    font_size = max(span["size"] for span in line["spans"])
-                    y = line["bbox"][1]
-                    cap_ratio = sum(c.isupper() for c in text if c.isalpha()) / max(1, len(text))
-                    word_count = len(text.split())
-                    ends_with_punct = text[-1] in ".:;"
+        table = get_line_table(pdf_path, pages, enough_candidates if max_headings is not None else None, persist)
+        lines = []
 
-                    lines.append({
-                        "text": text,
-                        "font_size": font_size,
-                        "y": y,
-                        "page": page_num + 1,
-                        "word_count": word_count,
-                        "cap_ratio": cap_ratio,
-                        "ends_with_punct": ends_with_punct
-                    })
+        for text, font_size, y, page in zip(table.texts(), table.sizes.tolist(),
+                                          table.bboxes[:, 1].tolist(), table.pages.tolist()):
+            if len(text) < 4:
+                continue
+
+            cap_ratio = sum(c.isupper() for c in text if c.isalpha()) / max(1, len(text))
+            word_count = len(text.split())
+            ends_with_punct = text[-1] in ".:;"
+
+            lines.append({
+                "text": text,
+                "font_size": font_size,
+                "y": y,
+                "page": page,
+                "word_count": word_count,
+                "cap_ratio": cap_ratio,
+                "ends_with_punct": ends_with_punct
+            })
 
         if not lines:
             return "Unknown Title", []
@@ -45,40 +55,16 @@ def extract_outline(pdf_path):
         title = title_line["text"]
 
         # ---------- Filter candidate headings ----------
-        candidates = [
-            l for l in lines
-            if l["font_size"] >= 8 and
-            l["word_count"] <= 15 and
-            not l["ends_with_punct"]
-        ]
+        candidates = [l for l in lines if _is_candidate(l["text"], l["font_size"])]
 
         if not candidates:
             return title, []
 
         # ---------- Simple font-based clustering ----------
         try:
-            # Use font size and position for clustering
-            font_sizes = np.array([[l["font_size"]] for l in candidates])
-            y_positions = np.array([[l["y"] / 1000.0] for l in candidates])
-            X = np.hstack([font_sizes, y_positions])
-
-            # KMeans clustering
-            try:
-                kmeans = KMeans(n_clusters=3, random_state=42, n_init="auto").fit(X)
-            except:
-                kmeans = KMeans(n_clusters=2, random_state=42, n_init="auto").fit(X)
-
-            cluster_labels = kmeans.labels_
-
-            # Sort clusters by average font size
-            cluster_to_level = {}
-            cluster_fonts = {}
-            for i in range(kmeans.n_clusters):
-                cluster_fonts[i] = np.mean([candidates[j]["font_size"] for j in range(len(candidates)) if cluster_labels[j] == i])
-
-            sorted_clusters = sorted(cluster_fonts.items(), key=lambda x: -x[1])
-            for rank, (cluster_id, _) in enumerate(sorted_clusters):
-                cluster_to_level[cluster_id] = f"H{rank + 1}"
+            # Exact 1-D k-means over the histogram of candidate font sizes
+            font_sizes = np.array([l["font_size"] for l in candidates])
+            levels, _ = cluster_labels(font_sizes, 3)
 
             # ---------- Final outline ----------
             outline = []
@@ -86,11 +72,13 @@ def extract_outline(pdf_path):
                 if line["text"] == title:
                     continue  # avoid duplication of title
                 outline.append({
-                    "level": cluster_to_level[cluster_labels[i]],
+                    "level": f"H{levels[i] + 1}",
                     "text": line["text"],
                     "page": line["page"]
                 })
 
+            # cut in reading order, so the first headings of the last page are kept
+            outline = outline[:max_headings]
             # Sort by page and y-position for consistency
             outline = sorted(outline, key=lambda l: (l["page"], l["text"]))
             return title, outline
@@ -114,8 +102,10 @@ def extract_outline(pdf_path):
                     "text": line["text"],
                     "page": line["page"]
                 })
-            return title, outline
+            return title, outline[:max_headings]
             
+    except PageRangeError:
+        raise                                   # reported to the caller, not an empty outline
     except Exception as e:
         print(f"Error in extract_outline: {e}")
         return "Unknown Title", []
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Production entry point for the PDF extraction API.
+
+Runs api_server.app under gunicorn with a fixed pool of pre-forked workers.
+Every worker imports and warms the extractors and NLP models once, right
+after it starts, so requests never pay for model loading.  Where gunicorn is
+unavailable (e.g. Windows) it falls back to waitress, which serves from a
+single warmed process with a thread pool.
+
+Usage:
+    python serve_api.py --workers 4 --threads 4 --max-concurrency 2
+"""
+
+import argparse
+import os
+import sys
+
+
+def _warm_worker(worker):
+    from api_server import warm_extractors
+    warm_extractors()
+
+
+def run_gunicorn(args):
+    from gunicorn.app.base import BaseApplication
+
+    # the workers share the cores: each one's page and section pools get a
+    # slice of them instead of one process per core each
+    cores_per_worker = str(max(1, (os.cpu_count() or 1) // max(1, args.workers)))
+    os.environ.setdefault("PDF_PAGE_WORKERS", cores_per_worker)
+    os.environ.setdefault("PERSONA_SECTION_WORKERS", cores_per_worker)
+
+    class ExtractorApplication(BaseApplication):
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from api_server import app
+            return app
+
+    ExtractorApplication({
+        "bind": args.bind,
+        "workers": args.workers,
+        "threads": args.threads,
+        "worker_class": "gthread" if args.threads > 1 else "sync",
+        "timeout": args.timeout,
+        "preload_app": False,          # each worker imports its own models
+        "post_worker_init": _warm_worker,
+    }).run()
+
+
+def run_waitress(args):
+    from waitress import serve
+    from api_server import app, warm_extractors
+    warm_extractors()
+    host, _, port = args.bind.rpartition(":")
+    serve(app, host=host or "0.0.0.0", port=int(port), threads=args.workers * args.threads)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the PDF extraction API with warmed worker processes.")
+    parser.add_argument("--bind", default=os.environ.get("PDF_API_BIND", "0.0.0.0:5000"),
+                        help="host:port to listen on (default 0.0.0.0:5000)")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("PDF_API_WORKERS", os.cpu_count() or 1)),
+                        help="pre-forked worker processes (default: one per CPU core)")
+    parser.add_argument("--threads", type=int, default=int(os.environ.get("PDF_API_THREADS", "2")),
+                        help="request threads per worker (default 2)")
+    parser.add_argument("--max-concurrency", type=int, default=None,
+                        help="extractions allowed to run at once in each worker")
+    parser.add_argument("--timeout", type=int, default=300,
+                        help="seconds before a silent worker is restarted (default 300)")
+    args = parser.parse_args()
+
+    if args.max_concurrency is not None:
+        # read by api_server when each worker imports it
+        os.environ["PDF_API_MAX_CONCURRENCY"] = str(args.max_concurrency)
+
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        try:
+            import waitress  # noqa: F401
+        except ImportError:
+            print("[ERROR] Neither gunicorn nor waitress is installed. Please install one with 'pip install gunicorn' or 'pip install waitress'.")
+            sys.exit(1)
+        print("[INFO] gunicorn not available, serving with waitress.")
+        run_waitress(args)
+        return
+    run_gunicorn(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,34 +1,268 @@
 import spacy
 import re
-from collections import Counter
+from collections import Counter, OrderedDict
+import hashlib
+import itertools
 import json
 import os
+import threading
+import numpy as np
+from outline_extractor.ranking_utils import get_bm25_index, select_top_k
+from language_utils import detect_language, detect_languages
+
+PIPE_BATCH_SIZE = int(os.environ.get("SPACY_PIPE_BATCH_SIZE", "64"))
+PIPE_PROCESSES = int(os.environ.get("SPACY_PIPE_PROCESSES", "1"))
+VECTOR_CACHE_SIZE = int(os.environ.get("SPACY_VECTOR_CACHE_SIZE", "50000"))
+VECTOR_PIPES = ("tok2vec", "transformer")   # the only components Doc vectors depend on
+CHUNK_CHARS = int(os.environ.get("SPACY_CHUNK_CHARS", "20000"))   # longer texts are streamed in chunks
+STREAM_BATCH_SIZE = 4                       # chunks parsed (and held) at a time
+SENTENCE_END_RE = re.compile(r'[.!?]\s+|[。！？]')
+MODEL_MEMORY_MB = float(os.environ.get("SPACY_MODEL_MEMORY_MB", "1024"))
+MIN_ROUTING_CONFIDENCE = 0.5                # weaker language guesses use the multilingual model
+
+# Language code -> spaCy pipelines to try, in order; the first installed one
+# is used. Override with SPACY_LANGUAGE_MODELS="en=en_core_web_md,de=de_core_news_lg".
+LANGUAGE_MODELS = {
+    "en": ["en_core_web_sm", "en_core_web_md"],
+    "de": ["de_core_news_sm", "de_core_news_md"],
+    "fr": ["fr_core_news_sm", "fr_core_news_md"],
+    "es": ["es_core_news_sm", "es_core_news_md"],
+    "pt": ["pt_core_news_sm", "pt_core_news_md"],
+    "pl": ["pl_core_news_sm", "pl_core_news_md"],
+    "da": ["da_core_news_sm", "da_core_news_md"],
+    "el": ["el_core_news_sm", "el_core_news_md"],
+    "ru": ["ru_core_news_sm", "ru_core_news_md"],
+    "ja": ["ja_core_news_sm", "ja_core_news_md"],
+    "zh": ["zh_core_web_sm", "zh_core_web_md"],
+    "ko": ["ko_core_news_sm", "ko_core_news_md"],
+}
+for _entry in filter(None, os.environ.get("SPACY_LANGUAGE_MODELS", "").split(",")):
+    _code, _, _name = _entry.partition("=")
+    LANGUAGE_MODELS[_code.strip()] = [_name.strip()]
+
+def _package_bytes(model_name):
+    """On-disk size of an installed pipeline, used as its memory estimate"""
+    try:
+        path = spacy.util.get_package_path(model_name)
+    except Exception:
+        return 0
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+class SpacyModelPool:
+    """
+    Per-language spaCy pipelines, loaded on first use and shared by all
+    threads. When the loaded models exceed the memory budget the least
+    recently used ones are dropped (pinned models are always kept).
+    """
+    
+    def __init__(self, language_models=None, memory_budget=int(MODEL_MEMORY_MB * 1024 * 1024)):
+        self.language_models = language_models or LANGUAGE_MODELS
+        self.memory_budget = memory_budget
+        self._models = OrderedDict()     # model name -> (nlp, estimated bytes)
+        self._pinned = set()
+        self._installed = {}             # language code -> installed model name or None
+        self._lock = threading.Lock()
+        self._load_locks = {}
+    
+    def model_for_language(self, code):
+        """Name of the installed pipeline for a language code, or None"""
+        with self._lock:
+            if code not in self._installed:
+                candidates = self.language_models.get(code, [])
+                self._installed[code] = next((name for name in candidates if spacy.util.is_package(name)), None)
+            return self._installed[code]
+    
+    def load(self, model_name, pin=False):
+        """Return the loaded pipeline ``model_name``, loading it once if needed"""
+        with self._lock:
+            if model_name in self._models:
+                self._models.move_to_end(model_name)
+                if pin:
+                    self._pinned.add(model_name)
+                return self._models[model_name][0]
+            load_lock = self._load_locks.setdefault(model_name, threading.Lock())
+        
+        # one thread loads a model while others asking for it wait
+        with load_lock:
+            with self._lock:
+                if model_name in self._models:
+                    self._models.move_to_end(model_name)
+                    return self._models[model_name][0]
+            nlp = spacy.load(model_name)
+            size = _package_bytes(model_name)
+            with self._lock:
+                self._models[model_name] = (nlp, size)
+                if pin:
+                    self._pinned.add(model_name)
+                self._evict(keep=model_name)
+            print(f"[INFO] Loaded spaCy model: {model_name}")
+            return nlp
+    
+    def _evict(self, keep):
+        total = sum(size for _, size in self._models.values())
+        for name in list(self._models):
+            if total <= self.memory_budget:
+                break
+            if name == keep or name in self._pinned:
+                continue
+            total -= self._models.pop(name)[1]
+            print(f"[INFO] Unloaded spaCy model {name} (memory budget)")
+    
+    def stats(self):
+        with self._lock:
+            return {
+                'loaded': list(self._models),
+                'bytes': sum(size for _, size in self._models.values()),
+                'budget': self.memory_budget,
+            }
+
+def split_text_chunks(text, max_chars):
+    """
+    Yield ``(offset, chunk)`` pieces of ``text`` of at most ``max_chars``,
+    cut after a blank line where possible, otherwise after a sentence end
+    """
+    start = 0
+    while start < len(text):
+        end = min(start + max_chars, len(text))
+        if end < len(text):
+            cut = text.rfind("\n\n", start, end)
+            if cut > start:
+                end = cut + 2
+            else:
+                last = None
+                for last in SENTENCE_END_RE.finditer(text, start, end):
+                    pass
+                if last is not None and last.end() > start:
+                    end = last.end()
+        yield start, text[start:end]
+        start = end
+
+class _StreamingAnalysis:
+    """Structure stats, entities and key phrases accumulated one Doc chunk at a time"""
+    
+    def __init__(self, parts, max_phrases=10):
+        self.parts = set(parts)
+        self.errors = {}
+        self.max_phrases = max_phrases
+        self.sentences = self.tokens = self.noun_phrases = self.entity_count = 0
+        self.entity_types = Counter()
+        self.key_entities = []
+        self.entities = []
+        self._phrases = {}   # insertion-ordered set
+    
+    def fail(self, part, error):
+        self.parts.discard(part)
+        self.errors[part] = error
+    
+    def add(self, offset, doc):
+        if "structure" in self.parts:
+            try:
+                self.sentences += len(list(doc.sents))
+                self.noun_phrases += len(list(doc.noun_chunks))
+                self.tokens += len(doc)
+                self.entity_count += len(doc.ents)
+                self.entity_types.update(ent.label_ for ent in doc.ents)
+                self.key_entities.extend(ent.text for ent in doc.ents[:5 - len(self.key_entities)])
+            except Exception as e:
+                self.fail("structure", e)
+        if "entities" in self.parts:
+            try:
+                for ent in doc.ents:
+                    self.entities.append({
+                        'text': ent.text,
+                        'label': ent.label_,
+                        'start': ent.start_char + offset,
+                        'end': ent.end_char + offset
+                    })
+            except Exception as e:
+                self.fail("entities", e)
+        if "key_phrases" in self.parts and len(self._phrases) < self.max_phrases:
+            try:
+                # Noun phrases of at least 2 words, then named entities
+                for chunk in doc.noun_chunks:
+                    if len(chunk.text.split()) >= 2:
+                        self._phrases.setdefault(chunk.text)
+                for ent in doc.ents:
+                    self._phrases.setdefault(ent.text)
+            except Exception as e:
+                self.fail("key_phrases", e)
+    
+    def structure(self, language):
+        return {
+            'sentences': self.sentences,
+            'tokens': self.tokens,
+            'entities': self.entity_count,
+            'noun_phrases': self.noun_phrases,
+            'language': language,
+            'entity_types': self.entity_types,
+            'key_entities': self.key_entities  # Top 5 entities
+        }
+    
+    def key_phrases(self):
+        # Duplicates removed (keeping first occurrences) and limited
+        return list(self._phrases)[:self.max_phrases]
+
+def _has_vectors(nlp):
+    """
+    Whether Doc vectors of ``nlp`` carry meaning: it needs word vectors or a
+    shared tok2vec/transformer component (``xx_ent_wiki_sm`` has neither and
+    its vectors are all zero)
+    """
+    if any(name in VECTOR_PIPES for name in nlp.pipe_names):
+        return True
+    vectors = getattr(getattr(nlp, "vocab", None), "vectors", None)
+    return vectors is not None and vectors.shape[0] > 0
 
 class SpacyMultilingualProcessor:
     def __init__(self):
         """Initialize spaCy with multilingual model"""
         self.nlp = None
+        self.model_name = None
         self.language_detected = None
         self.model_loaded = False
+        self.pool = SpacyModelPool()
+        self._vector_cache = OrderedDict()   # (model name, text hash) -> Doc vector
+        self._vector_lock = threading.Lock()
         
     def load_model(self, model_name="xx_ent_wiki_sm"):
-        """Load spaCy multilingual model"""
+        """Load spaCy multilingual model (the default for languages without their own pipeline)"""
         try:
-            self.nlp = spacy.load(model_name)
+            self.nlp = self.pool.load(model_name, pin=True)
+            self.model_name = model_name
             self.model_loaded = True
-            print(f"[INFO] Loaded spaCy model: {model_name}")
             return True
         except OSError:
             print(f"[WARNING] Model {model_name} not found. Please install with: python -m spacy download {model_name}")
             return False
     
+    def nlp_for(self, text):
+        """
+        ``(model name, pipeline)`` for the language of ``text``: the installed
+        per-language pipeline when the language is clear, else the default
+        """
+        guesses = detect_languages(text, top_n=1)
+        if guesses and guesses[0]['confidence'] >= MIN_ROUTING_CONFIDENCE:
+            model_name = self.pool.model_for_language(guesses[0]['code'])
+            if model_name is not None and model_name != self.model_name:
+                try:
+                    return model_name, self.pool.load(model_name)
+                except Exception as e:
+                    print(f"[WARNING] Failed to load spaCy model {model_name}: {e}")
+        return self.model_name, self.nlp
+    
     def detect_language(self, text):
         """Detect the language of the text"""
         if not self.model_loaded:
             return "unknown"
         
         try:
-            doc = self.nlp(text[:1000])  # Use first 1000 chars for language detection
             # spaCy doesn't have built-in language detection, so we'll use a simple heuristic
             # based on character sets and common words
             return self._simple_language_detection(text)
@@ -37,30 +271,52 @@ class SpacyMultilingualProcessor:
             return "unknown"
     
     def _simple_language_detection(self, text):
-        """Simple language detection based on character patterns"""
-        text_lower = text.lower()
-        
-        # Check for common language patterns
-        if re.search(r'[а-яё]', text):
-            return "russian"
-        elif re.search(r'[一-龯]', text):
-            return "chinese"
-        elif re.search(r'[あ-んア-ン]', text):
-            return "japanese"
-        elif re.search(r'[가-힣]', text):
-            return "korean"
-        elif re.search(r'[ا-ي]', text):
-            return "arabic"
-        elif re.search(r'[α-ωΑ-Ω]', text):
-            return "greek"
-        elif re.search(r'[à-ÿÀ-Ÿ]', text):
-            return "french"
-        elif re.search(r'[äöüßÄÖÜ]', text):
-            return "german"
-        elif re.search(r'[ñáéíóúüÑÁÉÍÓÚÜ]', text):
-            return "spanish"
-        else:
-            return "english"
+        """Most likely language from a single-pass script/letter histogram"""
+        return detect_language(text)
+    
+    def detect_languages(self, text, top_n=3):
+        """Ranked language guesses with confidence; cheap enough to call per section"""
+        return detect_languages(text, top_n)
+    
+    def iter_docs(self, text, chunk_chars=None):
+        """
+        Yield ``(char offset, Doc)`` for ``text``. Long texts are split into
+        bounded chunks at paragraph or sentence boundaries and parsed lazily
+        through ``nlp.pipe``, so only a few chunks are in memory at a time.
+        Each chunk is parsed by the pipeline for its own language.
+        """
+        max_chars = min(chunk_chars or CHUNK_CHARS, self.nlp.max_length)
+        if len(text) <= max_chars:
+            yield 0, self.nlp_for(text)[1](text)
+            return
+        routed = ((self.nlp_for(chunk)[1], chunk, offset) for offset, chunk in split_text_chunks(text, max_chars))
+        # consecutive chunks in the same language share one nlp.pipe stream
+        for nlp, run in itertools.groupby(routed, key=lambda item: item[0]):
+            chunks = ((chunk, offset) for _, chunk, offset in run)
+            for doc, offset in nlp.pipe(chunks, as_tuples=True, batch_size=STREAM_BATCH_SIZE):
+                yield offset, doc
+    
+    def stream_entities(self, text):
+        """Yield named entities of ``text`` chunk by chunk, with offsets into the full text"""
+        for offset, doc in self.iter_docs(text):
+            for ent in doc.ents:
+                yield {
+                    'text': ent.text,
+                    'label': ent.label_,
+                    'start': ent.start_char + offset,
+                    'end': ent.end_char + offset
+                }
+    
+    def _stream_analysis(self, text, parts, max_phrases=10):
+        """Run the requested analysis parts over the streamed Docs of ``text`` in one pass"""
+        analysis = _StreamingAnalysis(parts, max_phrases)
+        try:
+            for offset, doc in self.iter_docs(text):
+                analysis.add(offset, doc)
+        except Exception as e:
+            for part in list(analysis.parts):
+                analysis.fail(part, e)
+        return analysis
     
     def extract_entities(self, text):
         """Extract named entities from text"""
@@ -68,18 +324,7 @@ class SpacyMultilingualProcessor:
             return []
         
         try:
-            doc = self.nlp(text)
-            entities = []
-            
-            for ent in doc.ents:
-                entities.append({
-                    'text': ent.text,
-                    'label': ent.label_,
-                    'start': ent.start_char,
-                    'end': ent.end_char
-                })
-            
-            return entities
+            return list(self.stream_entities(text))
         except Exception as e:
             print(f"[ERROR] Entity extraction failed: {e}")
             return []
@@ -89,26 +334,11 @@ class SpacyMultilingualProcessor:
         if not self.model_loaded:
             return self._fallback_key_phrases(text, max_phrases)
         
-        try:
-            doc = self.nlp(text)
-            phrases = []
-            
-            # Extract noun phrases
-            for chunk in doc.noun_chunks:
-                if len(chunk.text.split()) >= 2:  # At least 2 words
-                    phrases.append(chunk.text)
-            
-            # Extract named entities
-            for ent in doc.ents:
-                phrases.append(ent.text)
-            
-            # Remove duplicates and limit
-            unique_phrases = list(set(phrases))
-            return unique_phrases[:max_phrases]
-            
-        except Exception as e:
-            print(f"[ERROR] Key phrase extraction failed: {e}")
+        stream = self._stream_analysis(text, ("key_phrases",), max_phrases)
+        if "key_phrases" in stream.errors:
+            print(f"[ERROR] Key phrase extraction failed: {stream.errors['key_phrases']}")
             return self._fallback_key_phrases(text, max_phrases)
+        return stream.key_phrases()
     
     def _fallback_key_phrases(self, text, max_phrases):
         """Fallback key phrase extraction using simple heuristics"""
@@ -130,24 +360,53 @@ class SpacyMultilingualProcessor:
         if not self.model_loaded:
             return self._fallback_text_analysis(text)
         
-        try:
-            doc = self.nlp(text)
-            
-            analysis = {
-                'sentences': len(list(doc.sents)),
-                'tokens': len(doc),
-                'entities': len(doc.ents),
-                'noun_phrases': len(list(doc.noun_chunks)),
-                'language': self.detect_language(text),
-                'entity_types': Counter([ent.label_ for ent in doc.ents]),
-                'key_entities': [ent.text for ent in doc.ents[:5]]  # Top 5 entities
-            }
-            
-            return analysis
-            
-        except Exception as e:
-            print(f"[ERROR] Text analysis failed: {e}")
+        stream = self._stream_analysis(text, ("structure",))
+        if "structure" in stream.errors:
+            print(f"[ERROR] Text analysis failed: {stream.errors['structure']}")
             return self._fallback_text_analysis(text)
+        return stream.structure(self.detect_language(text))
+    
+    def analyze(self, text, max_phrases=10):
+        """
+        Structure statistics, entities and key phrases of ``text`` from a
+        single streamed parse (instead of one parse per analysis method)
+        """
+        if not self.model_loaded:
+            analysis = self._fallback_text_analysis(text)
+            return {
+                'analysis': analysis,
+                'entities': [],
+                'key_phrases': self._fallback_key_phrases(text, max_phrases),
+                'language_detected': analysis['language']
+            }
+        
+        stream = self._stream_analysis(text, ("structure", "entities", "key_phrases"), max_phrases)
+        
+        # Each part falls back on its own, as the separate methods do
+        # (e.g. noun phrases need a parser the multilingual model lacks)
+        if "structure" in stream.errors:
+            print(f"[ERROR] Text analysis failed: {stream.errors['structure']}")
+            analysis = self._fallback_text_analysis(text)
+        else:
+            analysis = stream.structure(self.detect_language(text))
+        if "entities" in stream.errors:
+            print(f"[ERROR] Entity extraction failed: {stream.errors['entities']}")
+            entities = []
+        else:
+            entities = stream.entities
+        if "key_phrases" in stream.errors:
+            print(f"[ERROR] Key phrase extraction failed: {stream.errors['key_phrases']}")
+            key_phrases = self._fallback_key_phrases(text, max_phrases)
+        else:
+            key_phrases = stream.key_phrases()
+        
+        return {
+            'analysis': analysis,
+            'entities': entities,
+            'key_phrases': key_phrases,
+            'language_detected': analysis['language'],
+            'language_guesses': detect_languages(text)
+        }
     
     def _fallback_text_analysis(self, text):
         """Fallback text analysis using simple methods"""
@@ -164,50 +423,90 @@ class SpacyMultilingualProcessor:
             'key_entities': []
         }
     
-    def multilingual_search(self, query, text_sections, top_k=5):
+    def doc_vectors(self, texts, batch_size=None, n_process=None, model=None):
+        """
+        Doc vectors of ``texts`` as one matrix, from ``model`` (a
+        ``(model name, pipeline)`` pair, default the multilingual model).
+        Texts not seen before are parsed in batches with ``nlp.pipe``, running
+        only the components vectors depend on, and their vectors are cached
+        for later queries.
+        """
+        model_name, nlp = model or (self.model_name, self.nlp)
+        keys = [(model_name, hashlib.sha1(text.encode("utf-8", "surrogatepass")).hexdigest()) for text in texts]
+        vectors = [None] * len(texts)
+        missing = OrderedDict()   # key -> positions, so duplicate texts are parsed once
+        with self._vector_lock:
+            for i, key in enumerate(keys):
+                vector = self._vector_cache.get(key)
+                if vector is None:
+                    missing.setdefault(key, []).append(i)
+                else:
+                    self._vector_cache.move_to_end(key)
+                    vectors[i] = vector
+        
+        if missing:
+            disabled = [name for name in nlp.pipe_names if name not in VECTOR_PIPES]
+            docs = nlp.pipe(
+                (texts[positions[0]] for positions in missing.values()),
+                batch_size=batch_size or PIPE_BATCH_SIZE,
+                n_process=n_process or PIPE_PROCESSES,
+                disable=disabled,
+            )
+            for (key, positions), doc in zip(missing.items(), docs):
+                vector = np.asarray(doc.vector, dtype=np.float32)
+                for i in positions:
+                    vectors[i] = vector
+                with self._vector_lock:
+                    self._vector_cache[key] = vector
+                    if len(self._vector_cache) > VECTOR_CACHE_SIZE:
+                        self._vector_cache.popitem(last=False)
+        
+        if not vectors:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.vstack(vectors)
+    
+    def multilingual_search(self, query, text_sections, top_k=5, batch_size=None, n_process=None):
         """Enhanced multilingual search using spaCy"""
         if not self.model_loaded:
             return self._fallback_search(query, text_sections, top_k)
         
+        if not text_sections:
+            return []
+        
         try:
-            query_doc = self.nlp(query.lower())
-            scored_sections = []
+            # query and sections must share one pipeline for comparable vectors
+            model = self.nlp_for(query)
+            if not _has_vectors(model[1]):
+                return self._fallback_search(query, text_sections, top_k)
+            query_vector = self.doc_vectors([query.lower()], model=model)[0]
+            section_vectors = self.doc_vectors(
+                [f"{section.get('title', '')} {section.get('text', '')}".lower() for section in text_sections],
+                batch_size, n_process, model,
+            )
             
-            for section in text_sections:
-                section_text = f"{section.get('title', '')} {section.get('text', '')}"
-                section_doc = self.nlp(section_text.lower())
-                
-                # Calculate similarity using spaCy's similarity method
-                similarity = query_doc.similarity(section_doc)
-                scored_sections.append((similarity, section))
+            # Cosine similarity, as Doc.similarity computes it (0 for empty vectors)
+            norms = np.linalg.norm(section_vectors, axis=1) * np.linalg.norm(query_vector)
+            scores = np.divide(
+                section_vectors @ query_vector, norms,
+                out=np.zeros(len(text_sections), dtype=np.float64), where=norms > 0,
+            )
+            if not norms.any():
+                # no usable vectors at all: every score would be 0
+                return self._fallback_search(query, text_sections, top_k)
             
-            # Sort by similarity and return top results
-            ranked = sorted(scored_sections, key=lambda x: x[0], reverse=True)
-            return [section for _, section in ranked[:top_k]]
+            # Select the top results without sorting every section
+            return select_top_k(text_sections, scores, top_k)
             
         except Exception as e:
             print(f"[ERROR] Multilingual search failed: {e}")
             return self._fallback_search(query, text_sections, top_k)
     
     def _fallback_search(self, query, text_sections, top_k):
-        """Fallback search using simple text matching"""
-        query_words = set(re.findall(r'\w+', query.lower()))
-        scored_sections = []
-        
-        for section in text_sections:
-            section_text = f"{section.get('title', '')} {section.get('text', '')}"
-            section_words = set(re.findall(r'\w+', section_text.lower()))
-            
-            if query_words and section_words:
-                intersection = query_words.intersection(section_words)
-                similarity = len(intersection) / len(query_words.union(section_words))
-            else:
-                similarity = 0.0
-            
-            scored_sections.append((similarity, section))
+        """Fallback search using BM25 keyword scoring"""
+        index = get_bm25_index([f"{section.get('title', '')} {section.get('text', '')}" for section in text_sections])
+        scores = index.scores(query)
         
-        ranked = sorted(scored_sections, key=lambda x: x[0], reverse=True)
-        return [section for _, section in ranked[:top_k]]
+        return select_top_k(text_sections, scores, top_k)
 
 # Global instance
 spacy_processor = SpacyMultilingualProcessor()
@@ -39,6 +39,66 @@ def test_semantic_extractor():
         print(f"❌ Semantic extractor import failed: {e}")
         return False
 
+def test_spacy_search_without_vectors():
+    print("Testing multilingual search when spaCy vectors are all zero...")
+    try:
+        import numpy as np
+        from types import SimpleNamespace
+        from spacy_multilingual_utils import SpacyMultilingualProcessor
+    except ImportError as e:
+        print(f"⚠️ spaCy not available, skipped: {e}")
+        return True
+
+    class ZeroVectorPipeline:
+        # like xx_ent_wiki_sm: no word vectors, so every Doc vector is zero
+        def __init__(self, pipe_names):
+            self.pipe_names = pipe_names
+            self.vocab = SimpleNamespace(vectors=SimpleNamespace(shape=(0, 0)))
+
+        def pipe(self, texts, **kwargs):
+            for _ in texts:
+                yield SimpleNamespace(vector=np.zeros(96, dtype=np.float32))
+
+    sections = [
+        {"title": "Hiring", "text": "recruitment of new staff"},
+        {"title": "Budget", "text": "annual plan"},
+        {"title": "Travel", "text": "travel spending and travel budget"},
+    ]
+    for pipe_names in (["ner"], ["tok2vec", "ner"]):
+        processor = SpacyMultilingualProcessor()
+        processor.nlp, processor.model_name, processor.model_loaded = ZeroVectorPipeline(pipe_names), "xx_ent_wiki_sm", True
+        processor.nlp_for = lambda text: (processor.model_name, processor.nlp)
+        results = processor.multilingual_search("travel spending", sections, top_k=2)
+        # falls back to keyword ranking instead of returning the input order
+        assert results[0]["title"] == "Travel", results
+    print("✅ Zero-vector search falls back to keyword ranking")
+    return True
+
+def test_persona_headings_first_span_size():
+    print("Testing persona heading detection on lines with mixed font sizes...")
+    try:
+        import fitz
+        from persona_insight_extractor.heading_utils import extract_headings_and_text
+    except ImportError as e:
+        print(f"⚠️ PyMuPDF not available, skipped: {e}")
+        return True
+
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((50, 80), "Big Heading", fontsize=20)
+    writer = fitz.TextWriter(page.rect)
+    writer.append((50, 120), "small start ", fontsize=10)
+    writer.append(writer.last_point, "HUGE", fontsize=22)
+    writer.write_text(page)
+    page.insert_text((50, 160), "Body text follows here with more words in it.", fontsize=10)
+    pdf = doc.tobytes()
+    doc.close()
+    sections = extract_headings_and_text(pdf, "mixed.pdf")
+    # a line is sized by its first span, so the large word at its end does not split the page
+    assert [s["title"] for s in sections] == ["Big Heading"], sections
+    print("✅ Persona headings use the first span's font size")
+    return True
+
 def test_dependencies():
     print("Testing dependencies...")
     
@@ -50,14 +110,6 @@ def test_dependencies():
         print("❌ PyMuPDF (fitz) not available")
         return False
     
-    # Test sklearn
-    try:
-        from sklearn.cluster import KMeans
-        print("✅ sklearn available")
-    except ImportError:
-        print("❌ sklearn not available")
-        return False
-    
     # Test numpy
     try:
         import numpy as np
@@ -78,10 +130,14 @@ if __name__ == "__main__":
         outline_ok = test_outline_extractor()
         persona_ok = test_persona_extractor()
         semantic_ok = test_semantic_extractor()
+        spacy_search_ok = test_spacy_search_without_vectors()
+        headings_ok = test_persona_headings_first_span_size()
         
         print(f"\n=== Summary ===")
         print(f"Outline: {'✅' if outline_ok else '❌'}")
         print(f"Persona: {'✅' if persona_ok else '❌'}")
         print(f"Semantic: {'✅' if semantic_ok else '❌'}")
+        print(f"spaCy search: {'✅' if spacy_search_ok else '❌'}")
+        print(f"Persona headings: {'✅' if headings_ok else '❌'}")
     else:
         print("❌ Dependencies missing - cannot test extractors") 
\ No newline at end of file
@@ -0,0 +1,529 @@
+#!/usr/bin/env python3
+"""
+Watch-folder ingestion for the command-line extractors.
+
+Instead of rescanning ``input/`` and redoing every file, the watcher runs
+until interrupted and processes PDFs as they appear.  The input directory
+is watched with inotify on Linux (through libc, no extra package) and
+polled elsewhere.  A file is picked up once its size and modification time
+have stayed the same for ``--settle`` seconds, so scanners that write in
+several passes are not read half-way.  Files already processed (same size
+and mtime, or same content after a touch) are skipped, including the
+existing backlog on the first start when its outputs are newer than the
+PDFs.  New or changed PDFs are extracted by a pool of worker processes and
+every output is written to a temporary file and renamed into place.
+
+Usage:
+    python watch_folder.py outline                    # outline_extractor/input -> output
+    python watch_folder.py semantic --workers 4
+    python watch_folder.py persona --once             # catch up and exit
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import signal
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+SETTLE_SECONDS = float(os.environ.get("PDF_WATCH_SETTLE_SECONDS", "2"))
+POLL_INTERVAL = float(os.environ.get("PDF_WATCH_POLL_INTERVAL", "1"))
+RESCAN_INTERVAL = 60            # full rescan even without inotify events
+STATE_FILENAME = ".watch_state.json"
+PERSONA_FILENAME = "persona.json"
+PERSONA_OUTPUT = "challenge1b_output.json"
+
+# extractor -> its folder (input/ and output/ live inside)
+EXTRACTOR_DIRS = {
+    "outline": "outline_extractor",
+    "semantic": "semantic_outline_extractor",
+    "persona": "persona_insight_extractor",
+}
+
+# inotify event bits (linux/inotify.h)
+_IN_MODIFY = 0x002
+_IN_ATTRIB = 0x004
+_IN_CLOSE_WRITE = 0x008
+_IN_MOVED_FROM = 0x040
+_IN_MOVED_TO = 0x080
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_WATCH_MASK = (_IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM
+               | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE)
+
+
+def _outline_job(pdf_path):
+    try:
+        from outline_extractor.extractor import extract_outline_from_file
+    except ImportError as e:
+        return {"error": f"Failed to import outline extractor: {e}"}
+    return extract_outline_from_file(pdf_path, persist=True)
+
+
+def _semantic_job(pdf_path):
+    try:
+        from semantic_outline_extractor.main import extract_semantic_outline_from_file
+    except ImportError as e:
+        return {"error": f"Failed to import semantic extractor: {e}"}
+    return extract_semantic_outline_from_file(pdf_path, persist=True)
+
+
+# per-file extractors, run in worker processes
+_FILE_JOBS = {"outline": _outline_job, "semantic": _semantic_job}
+
+
+def _persona_job(documents, persona_path):
+    try:
+        from persona_insight_extractor.extractor_1b import extract_persona_insight_from_files
+    except ImportError as e:
+        return {"error": f"Failed to import persona extractor: {e}"}
+    try:
+        with open(persona_path, "r") as f:
+            persona_dict = json.load(f)
+    except (OSError, ValueError) as e:
+        return {"error": f"Failed to read {PERSONA_FILENAME}: {e}"}
+    return extract_persona_insight_from_files(documents, persona_dict, persist=True)
+
+
+def write_json_atomic(path, data):
+    """Write ``data`` as JSON next to ``path`` and rename it into place."""
+    tmp_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.{os.getpid()}.tmp")
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _open_inotify(directory):
+    """Return a non-blocking inotify fd watching ``directory``, or None."""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    if libc.inotify_add_watch(fd, os.fsencode(directory), _WATCH_MASK) < 0:
+        os.close(fd)
+        return None
+    return fd
+
+
+class DirectoryWatcher:
+    """
+    Blocks until the directory may have changed: an inotify event, a wake-up
+    from another thread, or the timeout.  Without inotify it polls.
+    """
+
+    def __init__(self, directory, poll_interval=POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self._inotify_fd = _open_inotify(directory)
+        # socket pair instead of a pipe so select() also works on Windows
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+
+    @property
+    def mode(self):
+        return "inotify" if self._inotify_fd is not None else "polling"
+
+    def wake(self):
+        """Interrupt a pending wait() (safe to call from any thread)."""
+        try:
+            self._wake_w.send(b"\0")
+        except OSError:
+            pass
+
+    def wait(self, timeout):
+        if self._inotify_fd is None:
+            timeout = self.poll_interval if timeout is None else min(timeout, self.poll_interval)
+        else:
+            timeout = RESCAN_INTERVAL if timeout is None else min(timeout, RESCAN_INTERVAL)
+        fds = [self._wake_r] + ([self._inotify_fd] if self._inotify_fd is not None else [])
+        readable, _, _ = select.select(fds, [], [], max(timeout, 0))
+        # the events themselves are not needed: the caller rescans the directory
+        if self._inotify_fd in readable:
+            try:
+                while os.read(self._inotify_fd, 65536):
+                    pass
+            except BlockingIOError:
+                pass
+        if self._wake_r in readable:
+            try:
+                while self._wake_r.recv(4096):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def close(self):
+        if self._inotify_fd is not None:
+            os.close(self._inotify_fd)
+            self._inotify_fd = None
+        self._wake_r.close()
+        self._wake_w.close()
+
+
+class FolderIngestor:
+    """
+    Processes new or changed PDFs of ``input_dir`` with one extractor and
+    writes the results to ``output_dir``.  What has been processed is kept
+    in ``output_dir/.watch_state.json`` (filename -> size, mtime, content
+    hash), so restarts do not redo the backlog.  Files that failed are kept
+    without a hash and retried when they change or the watcher restarts;
+    in persona mode they are also retried with every new ranking.
+    """
+
+    def __init__(self, kind, input_dir, output_dir, workers=None,
+                 settle=SETTLE_SECONDS, poll_interval=POLL_INTERVAL):
+        if kind not in EXTRACTOR_DIRS:
+            raise ValueError(f"unknown extractor '{kind}'")
+        self.kind = kind
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.workers = workers or os.cpu_count() or 1
+        self.settle = settle
+        self.poll_interval = poll_interval
+        self._state_path = os.path.join(output_dir, STATE_FILENAME)
+        self._state, self._failed = self._load_state()
+        self._pending = {}      # filename -> (signature, first seen with it)
+        self._running = {}      # filename -> (signature, content hash) being processed
+        self._waiting = {}      # persona mode: changed files not ranked yet, same values
+        self._persona_missing_reported = False
+        self._persona_future = None
+        self._done = []         # finished futures, appended by their callbacks
+        self._done_lock = threading.Lock()
+        self._pool = None
+        self._watcher = None
+
+    # state --------------------------------------------------------------
+
+    def _load_state(self):
+        try:
+            with open(self._state_path, "r", encoding="utf-8") as f:
+                files = json.load(f).get("files", {})
+        except (OSError, ValueError, AttributeError):
+            return {}, set()
+        # files that failed last time are tried again
+        failed = {name for name, record in files.items() if "error" in record}
+        return {name: record for name, record in files.items() if name not in failed}, failed
+
+    def _save_state(self):
+        write_json_atomic(self._state_path, {"extractor": self.kind, "files": self._state})
+
+    def _output_path(self, filename):
+        if self.kind == "persona":
+            return os.path.join(self.output_dir, PERSONA_OUTPUT)
+        return os.path.join(self.output_dir, os.path.splitext(filename)[0] + ".json")
+
+    def _adopt_backlog(self, seen):
+        """Mark files whose output is already newer than them as processed."""
+        adopted = 0
+        for filename, (size, mtime_ns) in seen.items():
+            if filename in self._state or filename in self._failed:
+                continue
+            try:
+                output_mtime = os.stat(self._output_path(filename)).st_mtime_ns
+            except OSError:
+                continue
+            if output_mtime >= mtime_ns:
+                self._state[filename] = {"size": size, "mtime_ns": mtime_ns, "sha256": None}
+                adopted += 1
+        if adopted:
+            print(f"[INFO] {adopted} file(s) already have up-to-date output; skipping them.")
+            self._save_state()
+
+    # scanning -----------------------------------------------------------
+
+    def _list_inputs(self):
+        """``{filename: (size, mtime_ns)}`` of the input files to watch."""
+        seen = {}
+        try:
+            entries = list(os.scandir(self.input_dir))
+        except OSError as e:
+            print(f"[WARNING] Cannot read input folder '{self.input_dir}': {e}")
+            return seen
+        for entry in entries:
+            name = entry.name
+            if name.startswith("."):
+                continue
+            if not (name.lower().endswith(".pdf") or (self.kind == "persona" and name == PERSONA_FILENAME)):
+                continue
+            try:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+            except OSError:
+                continue
+            seen[name] = (stat.st_size, stat.st_mtime_ns)
+        return seen
+
+    def _scan(self, seen, now):
+        """
+        Return ``(ready, removed, wait)``: files that changed and have been
+        stable for the settle time, tracked files that disappeared, and the
+        seconds until the next pending file settles (None if there is none).
+        """
+        removed = [name for name in self._state if name not in seen]
+        for name in removed:
+            del self._state[name]
+        for name in [name for name in self._pending if name not in seen]:
+            del self._pending[name]
+        for name in [name for name in self._waiting if name not in seen]:
+            del self._waiting[name]
+
+        ready, wait = [], None
+        for name, signature in seen.items():
+            if name in self._running:
+                continue
+            if name in self._waiting:
+                if self._waiting[name][0] == signature:
+                    continue
+                del self._waiting[name]             # changed again before it was ranked
+            record = self._state.get(name)
+            if record is not None and (record["size"], record["mtime_ns"]) == tuple(signature):
+                self._pending.pop(name, None)
+                continue
+            pending = self._pending.get(name)
+            if pending is None or pending[0] != signature:
+                # new file, or still being written: restart its settle timer
+                self._pending[name] = (signature, now)
+                remaining = self.settle
+            else:
+                remaining = self.settle - (now - pending[1])
+            if remaining <= 0:
+                del self._pending[name]
+                ready.append(name)
+            else:
+                wait = remaining if wait is None else min(wait, remaining)
+        return ready, removed, wait
+
+    def _changed(self, names, seen):
+        """Hash ``names`` and return those whose content really changed."""
+        from outline_extractor.cache_utils import file_hash
+
+        changed = {}
+        for name in names:
+            try:
+                digest = file_hash(os.path.join(self.input_dir, name))
+            except OSError as e:
+                print(f"[WARNING] Cannot read {name}: {e}")
+                continue
+            record = self._state.get(name)
+            if record is not None and record.get("sha256") == digest:
+                # touched or copied over with the same content
+                self._state[name] = {"size": seen[name][0], "mtime_ns": seen[name][1], "sha256": digest}
+                continue
+            changed[name] = (seen[name], digest)
+        return changed
+
+    # processing ---------------------------------------------------------
+
+    def _on_done(self, future):
+        with self._done_lock:
+            self._done.append(future)
+        self._watcher.wake()
+
+    def _submit_files(self, changed):
+        job = _FILE_JOBS[self.kind]
+        for name, (signature, digest) in changed.items():
+            print(f"[INFO] Processing {name}")
+            future = self._pool.submit(job, os.path.join(self.input_dir, name))
+            future.filename = name
+            future.started = time.time()
+            self._running[name] = (signature, digest)
+            future.add_done_callback(self._on_done)
+
+    def _submit_persona(self, seen):
+        """Rank the folder with the waiting changes; returns False without persona.json."""
+        if PERSONA_FILENAME not in seen:
+            if not self._persona_missing_reported:
+                print(f"[WARNING] {PERSONA_FILENAME} not found in '{self.input_dir}'; waiting for it.")
+                self._persona_missing_reported = True
+            return False
+        self._persona_missing_reported = False
+        if PERSONA_FILENAME in self._pending:
+            return True                         # ranked once it has settled
+        changed, self._waiting = self._waiting, {}
+        # every settled document is ranked again; unchanged ones reuse their stored embeddings
+        documents = sorted(
+            name for name in seen
+            if name != PERSONA_FILENAME and (name in self._state or name in changed)
+        )
+        if not documents:
+            # nothing to rank yet (e.g. only persona.json arrived)
+            self._running.update(changed)
+            self._record(list(changed))
+            self._save_state()
+            return True
+        print(f"[INFO] Ranking {len(documents)} document(s) ({len(changed)} new or changed file(s))")
+        future = self._pool.submit(
+            _persona_job,
+            [(name, os.path.join(self.input_dir, name)) for name in documents],
+            os.path.join(self.input_dir, PERSONA_FILENAME),
+        )
+        future.filename = None
+        future.started = time.time()
+        self._running.update(changed)
+        self._persona_future = future
+        future.add_done_callback(self._on_done)
+        return True
+
+    def _record(self, names, error=None):
+        for name in names:
+            (size, mtime_ns), digest = self._running.pop(name)
+            if error:
+                # no hash: a failed file is not skipped as unchanged once it
+                # is touched, and the next start tries it again
+                self._state[name] = {"size": size, "mtime_ns": mtime_ns, "sha256": None, "error": error}
+            else:
+                self._state[name] = {"size": size, "mtime_ns": mtime_ns, "sha256": digest}
+
+    def _collect(self):
+        with self._done_lock:
+            done, self._done = self._done, []
+        for future in done:
+            elapsed = time.time() - future.started
+            if self.kind == "persona":
+                names = list(self._running)
+                self._persona_future = None
+                label = "persona ranking"
+            else:
+                names = [future.filename]
+                label = future.filename
+            if future.cancelled():
+                # stopped before it ran: processed again on the next start
+                for name in names:
+                    self._running.pop(name, None)
+                continue
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"error": str(e)}
+            if "error" in result:
+                print(f"[ERROR] Failed to process {label}: {result['error']}")
+                self._record(names, result["error"])
+                continue
+            output_path = self._output_path(future.filename)
+            try:
+                if self.kind == "persona":
+                    write_json_atomic(output_path, result)
+                else:
+                    write_json_atomic(output_path, {"title": result["title"], "outline": result["outline"]})
+            except OSError as e:
+                print(f"[ERROR] Failed to write output for {label}: {e}")
+                for name in names:
+                    self._running.pop(name)
+                continue
+            # documents the ranking could not read are not done
+            failed = result.get("metadata", {}).get("failed_documents", {}) if self.kind == "persona" else {}
+            for name, error in failed.items():
+                print(f"[ERROR] Failed to process {name}: {error}")
+                if name in self._running:
+                    self._record([name], error)
+                elif name in self._state:
+                    self._state[name].update(sha256=None, error=error)
+            self._record([name for name in names if name not in failed])
+            print(f"[SUCCESS] {label} -> {os.path.basename(output_path)} ({elapsed:.2f}s)")
+        if done:
+            self._save_state()
+
+    def _busy(self):
+        return bool(self._running) or self._persona_future is not None
+
+    def run(self, once=False):
+        """
+        Watch and process until interrupted.  With ``once`` it returns as
+        soon as everything present has settled and been processed.
+        """
+        if not os.path.isdir(self.input_dir):
+            print(f"[ERROR] Input folder '{self.input_dir}' does not exist.")
+            sys.exit(1)
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._watcher = DirectoryWatcher(self.input_dir, self.poll_interval)
+        if self.kind == "persona":
+            # one ranking at a time; section extraction has its own process pool
+            self._pool = ThreadPoolExecutor(max_workers=1)
+        else:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        print(f"[INFO] Watching '{self.input_dir}' ({self._watcher.mode}) -> '{self.output_dir}'")
+        self._adopt_backlog(self._list_inputs())
+        try:
+            while True:
+                self._collect()
+                seen = self._list_inputs()
+                ready, removed, wait = self._scan(seen, time.monotonic())
+                if removed:
+                    self._save_state()
+                changed = self._changed(ready, seen) if ready else {}
+                if ready and not changed:
+                    self._save_state()
+                if self.kind == "persona":
+                    # changes wait for the running ranking (or for persona.json)
+                    self._waiting.update(changed)
+                    if (self._waiting or (removed and seen)) and self._persona_future is None:
+                        if not self._submit_persona(seen) and once and not self._pending:
+                            print(f"[ERROR] {PERSONA_FILENAME} not found in '{self.input_dir}'. Please provide it.")
+                            sys.exit(1)
+                elif changed:
+                    self._submit_files(changed)
+                if once and not self._busy() and not self._pending and not self._waiting:
+                    break
+                self._watcher.wait(wait)
+        except KeyboardInterrupt:
+            print("\n[INFO] Stopping watcher.")
+        finally:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._collect()
+            self._watcher.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Process PDFs dropped into an input folder as they arrive.")
+    parser.add_argument("extractor", choices=sorted(EXTRACTOR_DIRS), help="extractor to run on new PDFs")
+    parser.add_argument("--input", help="folder to watch (default: <extractor folder>/input)")
+    parser.add_argument("--output", help="folder for results (default: <extractor folder>/output)")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="worker processes for outline/semantic (0 = one per CPU core)")
+    parser.add_argument("--settle", type=float, default=SETTLE_SECONDS,
+                        help=f"seconds a file must stay unchanged before it is read (default {SETTLE_SECONDS:g})")
+    parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL,
+                        help=f"seconds between scans without inotify (default {POLL_INTERVAL:g})")
+    parser.add_argument("--once", action="store_true",
+                        help="process what is in the folder and exit instead of watching")
+    args = parser.parse_args()
+
+    base = os.path.join(ROOT, EXTRACTOR_DIRS[args.extractor])
+    if hasattr(signal, "SIGTERM"):
+        # stop cleanly under service managers, like Ctrl+C
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+    ingestor = FolderIngestor(
+        args.extractor,
+        args.input or os.path.join(base, "input"),
+        args.output or os.path.join(base, "output"),
+        workers=args.workers,
+        settle=args.settle,
+        poll_interval=args.poll_interval,
+    )
+    ingestor.run(once=args.once)
+
+
+if __name__ == "__main__":
+    main()